@@ -0,0 +1,354 @@
+"""Several independent arenas tiled in one window, each simulated in its own process.
+
+Every arena is a full Simulation (physics, modifiers, growing circles) running
+in a worker process. After each step the worker copies what the renderer
+needs (the balls, their collision lines and the growing circles) into a
+shared memory block, and the window process draws straight from it, without
+pickling or copying. Each block holds two slots: the worker always writes
+the slot the window is not drawing, and only one step per arena is ever in
+flight, so a frame never shows a half-written arena. Workers report each
+finished step, with its bounce count for the sound, over one shared queue.
+
+    python Arena.py --grid 3x2 --balls 2 --modifier Shrink_on_bounce
+
+Space adds a ball to every arena, clicking an arena adds one to that arena,
+and keys 1-5 toggle the same effects as in the game.
+"""
+import argparse
+import multiprocessing
+import queue
+import time
+import types
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from Modifiers import load_modifiers
+from Simulation import TOGGLES, Simulation, check_modifier_names
+
+GAME_RADIUS = 300  # The single-arena game's boundary radius; sizes and speeds scale from it
+
+
+def slot_layout(max_balls, max_particles, max_lines):
+    """(name, shape, dtype) of every array in one slot, in order."""
+    return (
+        ("counts", (2,), np.int64),  # Balls, growing circles
+        ("pos", (max_balls, 2), np.float64),
+        ("radius", (max_balls,), np.float64),
+        ("color", (max_balls, 3), np.uint8),
+        ("line_points", (max_balls, max_lines, 2), np.float64),
+        ("line_count", (max_balls,), np.int32),
+        ("line_head", (max_balls,), np.int32),
+        ("line_opacity", (max_balls,), np.float64),
+        ("particle_pos", (max_particles, 2), np.float64),
+        ("particle_radius", (max_particles,), np.float64),
+        ("particle_color", (max_particles, 3), np.uint8),
+        ("particle_alpha", (max_particles,), np.float64),
+        ("particle_layer", (max_particles,), np.int8),
+    )
+
+
+class ArenaBuffers:
+    """NumPy views of the two slots of one arena's shared memory block."""
+
+    def __init__(self, buffer, max_balls, max_particles, max_lines):
+        self.max_balls = max_balls
+        self.max_particles = max_particles
+        self.slots = []
+        offset = 0
+        for _ in range(2):
+            slot = {}
+            for name, shape, dtype in slot_layout(max_balls, max_particles, max_lines):
+                slot[name] = np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+                offset += -(-slot[name].nbytes // 8) * 8  # Keep every array 8-byte aligned
+            self.slots.append(slot)
+
+    @staticmethod
+    def size(max_balls, max_particles, max_lines):
+        return 2 * sum(-(-int(np.prod(shape)) * np.dtype(dtype).itemsize // 8) * 8
+                       for _, shape, dtype in slot_layout(max_balls, max_particles, max_lines))
+
+    def publish(self, index, simulation):
+        """Copy the simulation's drawable state into slot index."""
+        slot = self.slots[index]
+        world = simulation.world
+        n = min(world.count, self.max_balls)  # Balls beyond the block's capacity keep simulating but are not shown
+        for name in ("pos", "radius", "color", "line_points", "line_count", "line_head", "line_opacity"):
+            slot[name][:n] = getattr(world, name)[:n]
+        particles = simulation.particles
+        k = min(particles.count, self.max_particles)
+        for name in ("pos", "radius", "color", "alpha", "layer"):
+            slot["particle_" + name][:k] = getattr(particles, name)[:k]
+        slot["counts"][:] = (n, k)
+
+    def close(self):
+        self.slots = []  # Drop the views so the shared memory can be closed
+
+
+class SharedParticles:
+    """The part of ParticlePool the Renderer reads, over one slot."""
+
+    def __init__(self, slot):
+        self.pos = slot["particle_pos"]
+        self.radius = slot["particle_radius"]
+        self.color = slot["particle_color"]
+        self.alpha = slot["particle_alpha"]
+        self.layer = slot["particle_layer"]
+        self.count = 0
+
+    def indices(self, layer):
+        return np.flatnonzero(self.layer[:self.count] == layer)
+
+
+def slot_scene(slot, settings, max_lines):
+    """A Simulation look-alike over one slot, for Renderer.draw; call refresh_scene before drawing."""
+    center = np.array(settings["center"], dtype='float64')
+    world = types.SimpleNamespace(count=0, center=center, max_collision_lines=max_lines,
+                                  **{name: slot[name] for name in ("pos", "radius", "color", "line_points",
+                                                                  "line_count", "line_head", "line_opacity")})
+    return types.SimpleNamespace(world=world, particles=SharedParticles(slot), center=center,
+                                 circle_radius=settings["circle_radius"],
+                                 boundary_thickness=settings["boundary_thickness"],
+                                 show_lines=True, counts=slot["counts"])
+
+
+def refresh_scene(scene):
+    scene.world.count, scene.particles.count = (int(value) for value in scene.counts)
+
+
+def run_arena(index, settings, seed, selected, shm_name, max_balls, max_lines, commands, events):
+    """Worker process: step one arena whenever the window asks, publishing each result."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    buffers = ArenaBuffers(shm.buf, max_balls, settings["max_particles"], max_lines)
+    errors = []
+    simulation = Simulation(seed=seed, modifiers=load_modifiers(errors), max_collision_lines=max_lines, **settings)
+    simulation.isolate_modifiers = True
+    simulation.selected_modifiers = list(selected)
+    simulation.modifier_problems += [f"Could not load modifier {name}: {message}" for name, message in errors]
+
+    slot = 0
+    buffers.publish(slot, simulation)
+    events.put((index, slot, 0, simulation.modifier_problems))
+    simulation.modifier_problems = []
+    try:
+        while True:
+            command = commands.recv()
+            if command[0] == "step":
+                bounced = simulation.step(command[1])
+                slot ^= 1
+                buffers.publish(slot, simulation)
+                events.put((index, slot, len(bounced), simulation.modifier_problems))
+                simulation.modifier_problems = []
+            elif command[0] == "spawn":
+                simulation.spawn_ball()
+            elif command[0] == "set":
+                setattr(simulation, command[1], command[2])
+            elif command[0] == "stop":
+                break
+    except (EOFError, KeyboardInterrupt):
+        pass  # The window went away
+    finally:
+        buffers.close()
+        shm.close()
+
+
+class Arena:
+    """The window side of one arena: its worker process, shared memory and the slot to draw."""
+
+    def __init__(self, context, index, settings, seed, selected, max_balls, max_lines, events):
+        self.settings = settings
+        self.max_lines = max_lines
+        size = ArenaBuffers.size(max_balls, settings["max_particles"], max_lines)
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.buffers = ArenaBuffers(self.shm.buf, max_balls, settings["max_particles"], max_lines)
+        self.scenes = [slot_scene(slot, settings, max_lines) for slot in self.buffers.slots]
+        self.slot = None  # Latest published slot; None until the worker is up
+        self.busy = True  # A step (or the start-up) is in flight
+        self.pending_dt = 0.0  # Frame time that piled up while the worker was busy
+        receiver, self.commands = context.Pipe(duplex=False)
+        self.process = context.Process(target=run_arena, name=f"arena-{index}", daemon=True,
+                                       args=(index, settings, seed, selected, self.shm.name, max_balls, max_lines,
+                                             receiver, events))
+        self.process.start()
+
+    def published(self, slot):
+        self.slot = slot
+        self.busy = False
+
+    def step(self, dt):
+        """Ask for the next step, or bank dt until the one in flight is done."""
+        self.pending_dt += dt
+        if self.busy or self.slot is None:
+            return
+        self.commands.send(("step", self.pending_dt))
+        self.pending_dt = 0.0
+        self.busy = True
+
+    def send(self, *command):
+        self.commands.send(command)
+
+    @property
+    def scene(self):
+        if self.slot is None:
+            return None
+        scene = self.scenes[self.slot]
+        refresh_scene(scene)
+        return scene
+
+    def close(self):
+        try:
+            self.commands.send(("stop",))
+        except OSError:
+            pass
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.scenes = []
+        self.buffers.close()
+        self.shm.close()
+        self.shm.unlink()
+
+
+def arena_settings(tile, circle_radius=None):
+    """Simulation settings for one tile, scaled from the single-arena game."""
+    circle_radius = circle_radius or int(tile / 2 - 20)
+    scale = circle_radius / GAME_RADIUS
+    return {
+        "center": (tile / 2, tile / 2),
+        "circle_radius": circle_radius,
+        "boundary_thickness": max(int(round(10 * scale)), 2),
+        "gravity": (0, 300 * scale),
+        "ball_size": max(int(round(100 * scale)), 4),
+        "speed_range": (100 * scale, 1000 * scale),
+        "max_particles": 4096,
+    }
+
+
+def main(argv=None):
+    modifiers = load_modifiers()
+    parser = argparse.ArgumentParser(description="Run several arenas side by side, each in its own process.")
+    parser.add_argument("--grid", default="2x2", help="columns x rows of arenas (default: 2x2)")
+    parser.add_argument("--width", type=int, default=1440, help="window width in pixels (default: 1440)")
+    parser.add_argument("--height", type=int, default=720, help="window height in pixels (default: 720)")
+    parser.add_argument("--balls", type=int, default=1, help="balls per arena at the start (default: 1)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first arena; the others count up (default: 0)")
+    parser.add_argument("--modifier", action="append", default=[], metavar="NAME",
+                        help="enable a modifier in every arena; repeat for several (available: %s)" % ", ".join(modifiers))
+    parser.add_argument("--max-balls", type=int, default=256, help="balls drawn per arena (default: 256)")
+    parser.add_argument("--framerate", type=int, default=60, help="frames per second (default: 60)")
+    parser.add_argument("--no-audio", action="store_true", help="do not play the bounce notes")
+    args = parser.parse_args(argv)
+
+    try:
+        columns, rows = (int(part) for part in args.grid.lower().split("x"))
+    except ValueError:
+        parser.error(f"--grid must look like 3x2, got {args.grid!r}")
+    check_modifier_names(parser, args.modifier, modifiers)
+
+    tile = min(args.width // columns, args.height // rows)
+    settings = arena_settings(tile)
+    max_lines = 32
+
+    # Workers are started before pygame opens a window and use spawn, so they never inherit one
+    context = multiprocessing.get_context("spawn")
+    events = context.Queue()
+    arenas = [Arena(context, i, settings, args.seed + i, args.modifier, args.max_balls, max_lines, events)
+              for i in range(columns * rows)]
+    for arena in arenas:
+        for _ in range(args.balls):
+            arena.send("spawn")
+
+    import pygame
+
+    from Audio import AudioScheduler, NoteCache, load_game_midi
+    from Rendering import Renderer, SpriteCache
+
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode((columns * tile, rows * tile))
+    pygame.display.set_caption(f"{len(arenas)} arenas")
+    renderer = Renderer((tile, tile), SpriteCache(128 * 1024 * 1024))
+    tiles = [screen.subsurface(pygame.Rect((i % columns) * tile, (i // columns) * tile, tile, tile))
+             for i in range(len(arenas))]
+    font = pygame.font.Font(None, 24)
+
+    audio = None
+    if not args.no_audio:
+        _, midi_index = load_game_midi()
+        audio = AudioScheduler(midi_index, NoteCache(), open_mixer=True, use_voice_mixer=True)
+        audio.start()
+
+    toggles = {name: True for name in TOGGLES}
+    toggle_keys = dict(zip((pygame.K_1, pygame.K_2, pygame.K_4, pygame.K_5), TOGGLES))
+    change_hue = True
+    hue = 0.0
+    messages = []  # (text, time shown)
+    clock = pygame.time.Clock()
+    running = True
+    try:
+        while running:
+            dt = clock.tick(args.framerate) / 1000.0
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
+                elif event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_SPACE:
+                        for arena in arenas:
+                            arena.send("spawn")
+                    elif event.key == pygame.K_3:
+                        change_hue = not change_hue
+                    elif event.key in toggle_keys:
+                        name = toggle_keys[event.key]
+                        toggles[name] = not toggles[name]
+                        for arena in arenas:
+                            arena.send("set", name, toggles[name])
+                elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                    i = event.pos[1] // tile * columns + event.pos[0] // tile
+                    if event.pos[0] < columns * tile and i < len(arenas):
+                        arenas[i].send("spawn")
+
+            # Collect finished steps, then hand every idle arena its next one before drawing
+            bounces = 0
+            while True:
+                try:
+                    index, slot, bounce_count, problems = events.get_nowait()
+                except queue.Empty:
+                    break
+                arenas[index].published(slot)
+                bounces += bounce_count
+                messages += [(f"Arena {index + 1}: {problem}", time.time()) for problem in problems]
+            for arena in arenas:
+                arena.step(dt)
+            if audio is not None:
+                audio.advance(bounces)
+                while audio.problems:
+                    messages.append((audio.problems.popleft(), time.time()))
+
+            if change_hue:
+                hue = (hue + dt * 10) % 360
+                color = pygame.Color(0)
+                color.hsva = (hue, 100, 100, 100)
+            else:
+                color = pygame.Color(255, 255, 255)
+            for arena, surface in zip(arenas, tiles):
+                scene = arena.scene
+                if scene is None:
+                    surface.fill((0, 0, 0))
+                    continue
+                scene.show_lines = toggles["show_lines"]
+                renderer.draw(surface, scene, color)
+
+            messages = [(text, shown) for text, shown in messages if time.time() - shown < 5]
+            for i, (text, _) in enumerate(messages[-5:]):
+                screen.blit(font.render(text, True, (255, 255, 255)), (10, screen.get_height() - 30 * (i + 1)))
+            pygame.display.flip()
+    finally:
+        for arena in arenas:
+            arena.close()
+        if audio is not None:
+            audio.stop()
+        pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,550 @@
+"""MIDI loading, note synthesis and scheduling for MIDI playback."""
+import hashlib
+import os
+import queue
+import re
+import threading
+from collections import OrderedDict, deque
+
+import numpy as np
+import pygame
+
+SAMPLE_RATE = 44100
+
+# Envelope and level every bounce note is rendered with
+ATTACK = 0.01
+DECAY = 0.1
+SUSTAIN = 0.7
+RELEASE = 0.2
+AMPLITUDE = 0.0125
+
+
+MIDI_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'MIDI')
+MIDI_CACHE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.midi_cache')
+
+MIDI_EVENT_DTYPE = np.dtype([('time', 'f8'), ('note', 'u1'), ('velocity', 'u1'), ('type', 'u1')])
+NOTE_OFF = 0
+NOTE_ON = 1
+
+
+class MidiIndex:
+    """note_on/note_off events of a MIDI file with the chords bounces step through.
+
+    events is a structured array of (time, note, velocity, type), where time
+    is the delta in seconds from the previous event. Chord k is
+    events[chords[k]:chords[k + 1]].
+    """
+
+    def __init__(self, events, chords):
+        self.events = events
+        self.chords = chords
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, dtype=MIDI_EVENT_DTYPE), np.zeros(1, dtype=np.int64))
+
+    def __len__(self):
+        return len(self.chords) - 1
+
+    def chord(self, k):
+        """(note, duration in samples) for every note started by chord k."""
+        events = self.events[self.chords[k]:self.chords[k + 1]]
+        events = events[events['type'] == NOTE_ON]
+        return [(int(note), note_duration(time)) for note, time in zip(events['note'], events['time'])]
+
+    def notes(self):
+        """Every distinct (note, duration in samples) pair in the file."""
+        events = self.events[self.events['type'] == NOTE_ON]
+        return sorted({(int(note), note_duration(time)) for note, time in zip(events['note'], events['time'])})
+
+
+def find_chords(events):
+    """Chord boundaries, grouped the way the bounce cursor walks the file.
+
+    Starting from a boundary, the cursor consumes events until it has seen
+    at least one note_on and the next event comes after a time gap.
+    """
+    types = events['type'].tolist()
+    times = events['time'].tolist()
+    n = len(types)
+    chords = [0]
+    i = 0
+    while i < n:
+        found_note = False
+        while i < n:
+            found_note = found_note or types[i] == NOTE_ON
+            i += 1
+            if found_note and (i >= n or times[i] > 0):
+                break
+        chords.append(i)
+    return np.array(chords, dtype=np.int64)
+
+
+def parse_midi(path):
+    import mido
+
+    rows = [(msg.time, msg.note, msg.velocity, NOTE_ON if msg.type == 'note_on' else NOTE_OFF)
+            for msg in mido.MidiFile(path)
+            if not msg.is_meta and msg.type in ('note_on', 'note_off')]
+    events = np.array(rows, dtype=MIDI_EVENT_DTYPE)
+    return MidiIndex(events, find_chords(events))
+
+
+def load_midi_index(path, cache_folder):
+    """Parse a MIDI file once and memory-map the result on later runs.
+
+    The cache is keyed by the file's content hash and mtime, so an edited
+    file is parsed again; entries left over from older versions of the same
+    file are deleted when the new one is written.
+    """
+    with open(path, 'rb') as f:
+        digest = hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+    mtime = os.stat(path).st_mtime_ns
+    stem = os.path.splitext(os.path.basename(path))[0]
+    base = os.path.join(cache_folder, f"{stem}-{digest}-{mtime}")
+    events_path = base + ".events.npy"
+    chords_path = base + ".chords.npy"
+
+    if os.path.exists(events_path) and os.path.exists(chords_path):
+        try:
+            return MidiIndex(np.load(events_path, mmap_mode='r'), np.load(chords_path, mmap_mode='r'))
+        except (OSError, ValueError):
+            pass  # Unreadable cache entry; rebuild it below
+
+    index = parse_midi(path)
+    try:
+        os.makedirs(cache_folder, exist_ok=True)
+        stale = re.compile(re.escape(stem) + r"-[0-9a-f]{32}-\d+\.(events|chords)\.npy$")
+        for name in os.listdir(cache_folder):
+            if stale.match(name) and not os.path.join(cache_folder, name).startswith(base):
+                os.remove(os.path.join(cache_folder, name))
+        for target, array in ((events_path, index.events), (chords_path, index.chords)):
+            temp_path = f"{target}.{os.getpid()}.tmp"
+            with open(temp_path, 'wb') as f:
+                np.save(f, array)
+            os.replace(temp_path, target)
+    except OSError:
+        pass  # A read-only install still plays, it just parses every time
+    return index
+
+
+def load_game_midi(path=None):
+    """Load path, or else the first MIDI file in the MIDI folder, and return (path, MidiIndex).
+
+    Without any MIDI file the path is None and the index is empty, so bounces stay silent.
+    """
+    if path is None:
+        names = sorted(f for f in os.listdir(MIDI_FOLDER) if f.endswith('.mid')) if os.path.isdir(MIDI_FOLDER) else []
+        if not names:
+            return None, MidiIndex.empty()
+        path = os.path.join(MIDI_FOLDER, names[0])
+    return path, load_midi_index(path, MIDI_CACHE_FOLDER)
+
+
+def adsr_envelope(t, attack, decay, sustain, release):
+    total_samples = len(t)
+    attack_samples = min(int(attack * 44100), total_samples)
+    decay_samples = min(int(decay * 44100), total_samples - attack_samples)
+    release_samples = min(int(release * 44100), total_samples - attack_samples - decay_samples)
+    sustain_samples = total_samples - (attack_samples + decay_samples + release_samples)
+
+    env = np.zeros(total_samples)
+    env[:attack_samples] = np.linspace(0, 1, attack_samples)
+    env[attack_samples:attack_samples + decay_samples] = np.linspace(1, sustain, decay_samples)
+    if sustain_samples > 0:
+        env[attack_samples + decay_samples:attack_samples + decay_samples + sustain_samples] = sustain
+    if release_samples > 0:  # env[-0:] would be the whole envelope
+        env[-release_samples:] = np.linspace(sustain, 0, release_samples)
+
+    return env
+
+
+def note_duration(delta_time):
+    """Length in samples of a note whose message carries the given delta time."""
+    return int(SAMPLE_RATE * delta_time) if delta_time > 0 else SAMPLE_RATE
+
+
+def synthesize_note(note, duration, attack=ATTACK, decay=DECAY, sustain=SUSTAIN, release=RELEASE):
+    """Render a sine note with an ADSR envelope as interleaved stereo int16 samples."""
+    freq = 440.0 * (2.0 ** ((note - 69) / 12.0))
+    t = np.arange(duration) / float(SAMPLE_RATE)
+    samples = np.sin(2 * np.pi * freq * t).astype(np.float32)
+    samples *= adsr_envelope(t, attack, decay, sustain, release)
+
+    samples_stereo = np.column_stack((samples, samples))
+    samples_stereo *= AMPLITUDE  # Normalize the amplitude
+    return (samples_stereo * 32767).astype(np.int16)
+
+
+class BounceTrack:
+    """An offline track of bounce notes, mixed in one bounce at a time as a simulation runs.
+
+    Each bounce plays the next chord of the file, exactly like the live
+    game. Notes that would run past length samples are cut off.
+    """
+
+    def __init__(self, midi_index, length):
+        self.midi_index = midi_index
+        self.mix = np.zeros((length, 2), dtype=np.float32)
+        self.chord = 0
+        self._rendered = {}
+
+    def add(self, when):
+        """Mix in the chord of a bounce at when seconds."""
+        if len(self.midi_index) == 0:
+            return
+        if self.chord >= len(self.midi_index):
+            self.chord = 0
+        start = int(when * SAMPLE_RATE)
+        length = len(self.mix)
+        for note, duration in self.midi_index.chord(self.chord):
+            samples = self._rendered.get((note, duration))
+            if samples is None:
+                samples = self._rendered[(note, duration)] = synthesize_note(note, duration).astype(np.float32)
+            end = min(start + len(samples), length)
+            if end > start:
+                self.mix[start:end] += samples[:end - start]
+        self.chord += 1
+
+    def samples(self):
+        return np.clip(self.mix, -32768, 32767).astype(np.int16)
+
+
+def render_bounce_audio(midi_index, bounce_times, tail=1.0):
+    """Mix the chords a sequence of bounces would trigger into one stereo int16 track.
+
+    bounce_times holds one entry, in seconds, per bounce in the order they
+    happened.
+    """
+    track = BounceTrack(midi_index, int((max(bounce_times, default=0.0) + tail) * SAMPLE_RATE))
+    for when in bounce_times:
+        track.add(when)
+    return track.samples()
+
+
+class VoiceMixer:
+    """Every sounding note as rows of arrays, mixed into one stereo block at a time.
+
+    A voice is its phase (in cycles), frequency, position in samples (where
+    it is in the ADSR envelope), length and gain. render() evaluates all
+    voices for a whole block with one set of array operations, so the cost
+    grows with the block size times the voices sounding, not with Sound
+    objects or mixer channels, and polyphony is only limited by the CPU.
+    """
+
+    _fields = ("phase", "frequency", "position", "duration", "gain")
+
+    def __init__(self, attack=ATTACK, decay=DECAY, sustain=SUSTAIN, release=RELEASE, capacity=64):
+        self.attack = attack
+        self.decay = decay
+        self.sustain = sustain
+        self.release = release
+        self.count = 0
+        self.phase = np.zeros(capacity)
+        self.frequency = np.zeros(capacity)
+        self.position = np.zeros(capacity, dtype=np.int64)
+        self.duration = np.zeros(capacity, dtype=np.int64)
+        self.gain = np.zeros(capacity)
+
+    def note_on(self, notes, durations, gain=AMPLITUDE):
+        """Start one voice per note; durations are in samples."""
+        notes = np.asarray(notes, dtype=np.float64).ravel()
+        k = len(notes)
+        if k == 0:
+            return
+        if self.count + k > len(self.frequency):
+            capacity = max(len(self.frequency) * 2, self.count + k)
+            for name in self._fields:
+                array = getattr(self, name)
+                grown = np.zeros(capacity, dtype=array.dtype)
+                grown[:self.count] = array[:self.count]
+                setattr(self, name, grown)
+        rows = slice(self.count, self.count + k)
+        self.phase[rows] = 0
+        self.frequency[rows] = 440.0 * (2.0 ** ((notes - 69) / 12.0))
+        self.position[rows] = 0
+        self.duration[rows] = durations
+        self.gain[rows] = gain
+        self.count += k
+
+    def envelope(self, position, duration):
+        """adsr_envelope for many voices at once: position is (voices, samples), duration is (voices, 1)."""
+        attack = np.minimum(int(self.attack * SAMPLE_RATE), duration)
+        decay = np.minimum(int(self.decay * SAMPLE_RATE), duration - attack)
+        release = np.minimum(int(self.release * SAMPLE_RATE), duration - attack - decay)
+        release_start = duration - release
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # Each stage is a linspace with both ends included, like adsr_envelope
+            rising = np.where(attack > 1, position / (attack - 1), 0.0)
+            falling = 1 + (self.sustain - 1) * np.where(decay > 1, (position - attack) / (decay - 1), 0.0)
+            fading = self.sustain * (1 - np.where(release > 1, (position - release_start) / (release - 1), 0.0))
+        env = np.full(position.shape, float(self.sustain))
+        env = np.where(position < attack + decay, falling, env)
+        env = np.where(position < attack, rising, env)
+        env = np.where(position >= release_start, fading, env)
+        return np.where(position < duration, env, 0.0)
+
+    def render(self, frames):
+        """Mix the next frames samples of every voice into interleaved stereo int16 and advance them."""
+        n = self.count
+        if n == 0:
+            return np.zeros((frames, 2), dtype=np.int16)
+        # Phases are wrapped to [0, 1) in float64 between blocks, so float32 is exact enough within one
+        step = (self.frequency[:n] / SAMPLE_RATE).astype(np.float32)
+        cycles = self.phase[:n, None].astype(np.float32) + step[:, None] * np.arange(frames, dtype=np.float32)
+        samples = np.sin(np.float32(2 * np.pi) * cycles)
+
+        # Voices holding their sustain level for the whole block only need a constant gain
+        position, duration = self.position[:n], self.duration[:n]
+        ramp_end = np.minimum(int(self.attack * SAMPLE_RATE) + int(self.decay * SAMPLE_RATE), duration)
+        release_start = duration - np.minimum(int(self.release * SAMPLE_RATE), duration - ramp_end)
+        weights = self.gain[:n] * self.sustain
+        edge = np.flatnonzero((position < ramp_end) | (position + frames > release_start))
+        if len(edge):
+            window = position[edge, None] + np.arange(frames)
+            samples[edge] *= self.envelope(window, duration[edge, None]).astype(np.float32)
+            weights[edge] = self.gain[:n][edge]
+        mono = weights.astype(np.float32) @ samples * 32767
+
+        self.phase[:n] = (self.phase[:n] + self.frequency[:n] * frames / SAMPLE_RATE) % 1.0
+        self.position[:n] += frames
+        alive = self.position[:n] < self.duration[:n]
+        if not alive.all():
+            keep = np.flatnonzero(alive)
+            for name in self._fields:
+                array = getattr(self, name)
+                array[:len(keep)] = array[keep]
+            self.count = len(keep)
+        mono = np.clip(mono, -32768, 32767).astype(np.int16)
+        return np.column_stack((mono, mono))
+
+    def clear(self):
+        self.count = 0
+
+
+class NoteCache:
+    """LRU cache of ready-to-play Sounds keyed by note, duration and envelope."""
+
+    def __init__(self, byte_budget=64 * 1024 * 1024):
+        self.byte_budget = byte_budget
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._sounds = OrderedDict()
+
+    def get(self, note, duration, attack=ATTACK, decay=DECAY, sustain=SUSTAIN, release=RELEASE):
+        key = (note, duration, attack, decay, sustain, release)
+        entry = self._sounds.get(key)
+        if entry is not None:
+            self._sounds.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        samples = synthesize_note(note, duration, attack, decay, sustain, release)
+        sound = pygame.sndarray.make_sound(samples)
+        if samples.nbytes <= self.byte_budget:
+            self._sounds[key] = (sound, samples.nbytes)
+            self.bytes_used += samples.nbytes
+            while self.bytes_used > self.byte_budget:
+                _, (_, size) = self._sounds.popitem(last=False)
+                self.bytes_used -= size
+                self.evictions += 1
+        return sound
+
+    def warm_up(self, notes):
+        """Pre-render every distinct (note, duration) pair, e.g. all the notes of a MIDI file."""
+        for note, duration in dict.fromkeys(notes):
+            self.get(note, duration)
+        # Warm-up renders are expected; keep the counters about live playback
+        self.misses = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "sounds": len(self._sounds),
+            "bytes_used": self.bytes_used,
+        }
+
+
+_IDLE = object()  # What the worker handles when no command arrived in time
+
+
+class AudioScheduler:
+    """Plays the loaded MIDI file one chord per bounce, off the physics thread.
+
+    The game loop only calls advance(), which drops a command on a queue.
+    A worker thread walks the MIDI cursor, fetches Sounds from the
+    NoteCache and plays them on a fixed set of mixer channels. When every
+    channel is busy the oldest voice is stolen, and voices are forgotten as
+    soon as their channel goes quiet, so nothing accumulates over long runs.
+
+    With open_mixer set, the worker initializes pygame.mixer itself on the
+    first chord, so opening the audio device never delays startup.
+
+    With use_voice_mixer set, notes are not Sounds at all: they start voices
+    in a VoiceMixer, and the worker streams its output block by block
+    through a single channel with Channel.queue, so notes are never dropped
+    for lack of channels.
+    """
+
+    def __init__(self, midi_index, note_cache, max_voices=16, open_mixer=False, use_voice_mixer=False, block_size=512):
+        self.midi_index = midi_index
+        self.note_cache = note_cache
+        self.max_voices = max_voices
+        self.open_mixer = open_mixer
+        self.voice_mixer = VoiceMixer() if use_voice_mixer else None
+        self.block_size = block_size  # Samples per streamed block; two are queued ahead
+        self._stream = deque(maxlen=3)  # Blocks handed to the channel, kept alive while they play
+        self.current_chord = 0
+        self.notes_played = 0
+        self.voices_stolen = 0
+        self._voices = deque()  # (channel, sound), oldest first
+        self._channels = []
+        self._commands = queue.SimpleQueue()
+        self._thread = None
+        self._warm_up = deque()  # Notes still to pre-render while the worker is idle
+        self.problems = deque()  # Errors from the worker thread, for the game to show; each is reported once
+        self._reported = set()
+
+    @property
+    def active_voices(self):
+        if self.voice_mixer is not None:
+            return self.voice_mixer.count
+        return len(self._voices)
+
+    def start(self):
+        if pygame.mixer.get_init():
+            self._claim_channels()
+        self._thread = threading.Thread(target=self._run, name="audio", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._commands.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def advance(self, count=1):
+        """Queue the next count chords of the MIDI file. Safe to call from the hot loop."""
+        if count:
+            self._commands.put(count)
+
+    def set_midi_index(self, midi_index, warm_up=False):
+        """Switch to another MIDI file from the start; warm_up pre-renders its notes while idle."""
+        self._commands.put(("midi", midi_index, warm_up))
+
+    def _claim_channels(self):
+        if self.voice_mixer is not None:
+            self._channels = [pygame.mixer.Channel(0)]  # The stream
+            return
+        pygame.mixer.set_num_channels(self.max_voices)
+        self._channels = [pygame.mixer.Channel(i) for i in range(self.max_voices)]
+
+    def _ensure_mixer(self):
+        if self._channels or not self.open_mixer:
+            return
+        if not pygame.mixer.get_init():
+            try:
+                pygame.mixer.init()
+            except pygame.error:
+                self.open_mixer = False  # No audio device; stay silent instead of retrying every bounce
+                return
+        self._claim_channels()
+
+    def _run(self):
+        while True:
+            warming_up = bool(self._warm_up) and bool(self._channels)
+            streaming = self.voice_mixer is not None and self.voice_mixer.count > 0
+            timeout = 0 if warming_up else self.block_size / SAMPLE_RATE / 2 if streaming else 0.1
+            try:
+                command = self._commands.get(timeout=timeout)
+            except queue.Empty:
+                command = _IDLE
+            if command is None:
+                break
+            # Nobody would notice this thread dying, so a failure costs one command, not the rest of the session
+            try:
+                self._handle(command, streaming, warming_up)
+            except Exception as error:
+                message = f"Audio failed: {type(error).__name__}: {error}"
+                if message not in self._reported:
+                    self._reported.add(message)
+                    self.problems.append(message)
+
+    def _handle(self, command, streaming, warming_up):
+        if command is _IDLE:
+            if streaming:
+                self._feed_stream()
+                return
+            self._release_finished()
+            if warming_up:
+                self.note_cache.get(*self._warm_up.popleft())
+                if not self._warm_up:
+                    self.note_cache.misses = 0  # Keep the counters about live playback
+            return
+        if isinstance(command, tuple):
+            _, self.midi_index, warm_up = command
+            self.current_chord = 0
+            warm_up = warm_up and self.voice_mixer is None  # Voices are synthesized as they play
+            self._warm_up = deque(self.midi_index.notes()) if warm_up else deque()
+            return
+        self.play_chords(command)
+        if self.voice_mixer is not None:
+            self._feed_stream()
+
+    def play_chords(self, count):
+        """Play the next count chords on the calling thread; the worker thread's unit of work."""
+        self._ensure_mixer()
+        if self.voice_mixer is not None:
+            if self._channels:
+                notes = [note for _ in range(count) for note in self._next_chord()]
+                self.voice_mixer.note_on([note for note, _ in notes], [duration for _, duration in notes])
+                self.notes_played += len(notes)
+            return
+        self._release_finished()
+        for _ in range(count):
+            for note, duration in self._next_chord():
+                self._play(self.note_cache.get(note, duration))
+
+    def _feed_stream(self):
+        """Keep one block playing and the next one queued behind it."""
+        if not self._channels:
+            return
+        channel = self._channels[0]
+        while self.voice_mixer.count and (not channel.get_busy() or channel.get_queue() is None):
+            block = pygame.sndarray.make_sound(self.voice_mixer.render(self.block_size))
+            self._stream.append(block)
+            if channel.get_busy():
+                channel.queue(block)
+            else:
+                channel.play(block)
+
+    def _next_chord(self):
+        if len(self.midi_index) == 0:
+            return []
+        if self.current_chord >= len(self.midi_index):
+            self.current_chord = 0
+        chord = self.midi_index.chord(self.current_chord)
+        self.current_chord += 1
+        return chord
+
+    def _release_finished(self):
+        self._voices = deque((channel, sound) for channel, sound in self._voices
+                             if channel.get_busy() and channel.get_sound() is sound)
+
+    def _play(self, sound):
+        if not self._channels:
+            return
+        busy = {id(channel) for channel, _ in self._voices}
+        channel = next((c for c in self._channels if id(c) not in busy), None)
+        if channel is None:
+            channel, _ = self._voices.popleft()
+            channel.stop()
+            self.voices_stolen += 1
+        channel.play(sound)
+        self._voices.append((channel, sound))
+        self.notes_played += 1
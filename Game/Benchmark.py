@@ -0,0 +1,220 @@
+"""Scripted benchmark scenarios for the game's hot paths.
+
+Each scenario sets up a Simulation, runs it for a fixed number of frames at
+a fixed timestep and times every phase of the frame separately: ball
+update, ball-ball collisions, growing-circle update, audio, drawing and
+display.flip. Results go to a JSON file and are compared against a stored
+baseline so regressions show up as a non-zero exit code:
+
+    python Benchmark.py --output results.json
+    python Benchmark.py --update-baseline
+    python Benchmark.py --scenario balls-1000 --scenario trails-on-100
+
+Runs on SDL's dummy video and audio drivers unless --display is given, so
+display.flip timings are only meaningful with a real display.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+PHASES = ("update", "collisions", "particles", "audio", "draw", "flip")
+
+
+def balls(count):
+    def setup(simulation):
+        simulation.disable_effects()
+        for _ in range(count):
+            simulation.spawn_ball()
+    return setup
+
+
+def trails(enabled):
+    def setup(simulation):
+        simulation.disable_effects()
+        simulation.show_trail = enabled
+        for _ in range(100):
+            simulation.spawn_ball()
+    return setup
+
+
+def long_lived_lines(simulation):
+    """Balls that have already bounced thousands of times between them."""
+    simulation.disable_effects()
+    simulation.show_lines = True
+    world = simulation.world
+    rng = np.random.default_rng(0)
+    for _ in range(40):
+        simulation.spawn_ball()
+    angles = rng.uniform(0, 2 * np.pi, (world.count, world.max_collision_lines))
+    limit = world.circle_radius - world.boundary_thickness / 2
+    points = world.center + limit * np.stack((np.cos(angles), np.sin(angles)), axis=-1)
+    indices = np.repeat(np.arange(world.count), world.max_collision_lines)
+    world.record_collision_points(indices, points.reshape(-1, 2))
+
+
+def bounce_storm(simulation):
+    """Small, crowded arena where most balls hit the boundary every few frames."""
+    simulation.circle_radius = simulation.world.circle_radius = 150
+    simulation.ball_size = 30
+    for _ in range(500):
+        simulation.spawn_ball()
+
+
+def all_modifiers(simulation):
+    simulation.selected_modifiers = list(simulation.modifiers)
+    for _ in range(200):
+        simulation.spawn_ball()
+
+
+SCENARIOS = {
+    "balls-1": (balls(1), {}),
+    "balls-100": (balls(100), {}),
+    "balls-1000": (balls(1000), {}),
+    "balls-5000": (balls(5000), {}),
+    "trails-on-100": (trails(True), {}),
+    "trails-off-100": (trails(False), {}),
+    "long-lived-lines": (long_lived_lines, {"max_collision_lines": 2048}),
+    "bounce-storm": (bounce_storm, {}),
+    "all-modifiers": (all_modifiers, {}),
+}
+
+
+def synthetic_midi_index():
+    """A looping three-note arpeggio, so the audio phase runs without a MIDI file."""
+    from Audio import MIDI_EVENT_DTYPE, NOTE_ON, MidiIndex, find_chords
+
+    rows = [(0.25 if i % 3 == 0 else 0.0, 60 + i % 12, 64, NOTE_ON) for i in range(48)]
+    events = np.array(rows, dtype=MIDI_EVENT_DTYPE)
+    return MidiIndex(events, find_chords(events))
+
+
+def run_scenario(name, frames, dt, screen, modifiers, audio):
+    import pygame
+    from Rendering import Renderer, SpriteCache
+    from Simulation import Simulation
+
+    setup, options = SCENARIOS[name]
+    simulation = Simulation(seed=0, modifiers=modifiers, **options)
+    setup(simulation)
+    renderer = Renderer(screen.get_size(), SpriteCache(64 * 1024 * 1024))
+
+    timings = {phase: [] for phase in PHASES}
+    clock = time.perf_counter
+    for _ in range(frames):
+        t0 = clock()
+        bounced = simulation.update_balls(dt)
+        t1 = clock()
+        simulation.check_ball_collisions()
+        t2 = clock()
+        simulation.update_particles(dt)
+        t3 = clock()
+        audio.play_chords(len(bounced))
+        t4 = clock()
+        renderer.draw(screen, simulation, (255, 255, 255))
+        t5 = clock()
+        pygame.display.flip()
+        t6 = clock()
+        for phase, start, end in zip(PHASES, (t0, t1, t2, t3, t4, t5), (t1, t2, t3, t4, t5, t6)):
+            timings[phase].append((end - start) * 1000)
+        simulation.time += dt
+        simulation.steps += 1
+
+    result = {}
+    for phase, samples in timings.items():
+        samples = np.array(samples)
+        result[phase] = {
+            "mean_ms": float(samples.mean()),
+            "p50_ms": float(np.percentile(samples, 50)),
+            "p95_ms": float(np.percentile(samples, 95)),
+        }
+    frame = np.sum([timings[phase] for phase in PHASES], axis=0)
+    result["frame"] = {
+        "mean_ms": float(frame.mean()),
+        "p50_ms": float(np.percentile(frame, 50)),
+        "p95_ms": float(np.percentile(frame, 95)),
+    }
+    result["bounce_count"] = simulation.bounces
+    result["collision_count"] = simulation.collisions
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """Lines describing every phase whose mean got slower than the baseline allows."""
+    regressions = []
+    for name, phases in results.items():
+        for phase, stats in phases.items():
+            if not isinstance(stats, dict):
+                continue
+            reference = baseline.get(name, {}).get(phase)
+            if reference is None:
+                continue
+            # Ignore sub-0.05 ms phases; at that scale the noise is larger than any real change
+            allowed = max(reference["mean_ms"] * (1 + tolerance), reference["mean_ms"] + 0.05)
+            if stats["mean_ms"] > allowed:
+                regressions.append(f"{name}/{phase}: {stats['mean_ms']:.3f} ms vs baseline {reference['mean_ms']:.3f} ms")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the simulation, effects, rendering and audio.")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), metavar="NAME",
+                        help="run only this scenario; repeat for several (default: all of %s)" % ", ".join(SCENARIOS))
+    parser.add_argument("--frames", type=int, default=120, help="frames per scenario (default: 120)")
+    parser.add_argument("--dt", type=float, default=1 / 60, help="seconds per frame (default: 1/60)")
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write results (default: %(default)s)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="results to compare against (default: %(default)s)")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown against the baseline before failing, as a fraction (default: 0.25)")
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--display", action="store_true", help="use the real display and audio device instead of SDL's dummy drivers")
+    args = parser.parse_args(argv)
+
+    if not args.display:
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+    import pygame
+    from Audio import AudioScheduler, NoteCache
+    from Modifiers import load_modifiers
+
+    pygame.init()
+    screen = pygame.display.set_mode((720, 720), pygame.SRCALPHA)
+    modifiers = load_modifiers()
+    audio = AudioScheduler(synthetic_midi_index(), NoteCache())
+    if pygame.mixer.get_init():
+        audio._claim_channels()  # No worker thread: chords are played synchronously below, so nothing else touches the voices
+
+    results = {}
+    for name in args.scenario or SCENARIOS:
+        results[name] = run_scenario(name, args.frames, args.dt, screen, modifiers, audio)
+        stats = results[name]
+        print(f"{name:18} frame {stats['frame']['mean_ms']:8.2f} ms  " +
+              "  ".join(f"{phase} {stats[phase]['mean_ms']:.2f}" for phase in PHASES))
+    pygame.quit()
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to store one")
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    for line in regressions:
+        print("REGRESSION " + line)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,448 @@
+"""Structure-of-arrays ball simulation.
+
+Every ball lives in one row of a set of contiguous NumPy arrays owned by
+BallWorld, so integration and boundary collisions run as a single batched
+pass no matter how many balls are on screen. Ball objects are thin handles
+onto those rows, which keeps ball.size, ball.velocity and friends working
+for modifiers.
+"""
+import numpy as np
+
+
+class Ball:
+    def __init__(self, world, index):
+        self.world = world
+        self.index = index  # Kept up to date by BallWorld when rows move
+        self.has_bounced = False
+
+    @property
+    def pos(self):
+        return self.world.pos[self.index]
+
+    @pos.setter
+    def pos(self, value):
+        self.world.pos[self.index] = value
+
+    @property
+    def velocity(self):
+        return self.world.velocity[self.index]
+
+    @velocity.setter
+    def velocity(self, value):
+        self.world.velocity[self.index] = value
+
+    @property
+    def size(self):
+        return float(self.world.size[self.index])
+
+    @size.setter
+    def size(self, value):
+        self.world.size[self.index] = value
+
+    @property
+    def radius(self):
+        return float(self.world.radius[self.index])
+
+    @radius.setter
+    def radius(self, value):
+        self.world.radius[self.index] = value
+
+    @property
+    def color(self):
+        return tuple(int(c) for c in self.world.color[self.index])
+
+    @color.setter
+    def color(self, value):
+        self.world.color[self.index] = tuple(value)[:3]
+
+    @property
+    def collision_points(self):
+        """This ball's remembered collision points, oldest first."""
+        return self.world.collision_points(self.index)
+
+    @property
+    def invulnerable(self):
+        return bool(self.world.invulnerable[self.index])
+
+    @invulnerable.setter
+    def invulnerable(self, value):
+        self.world.invulnerable[self.index] = value
+
+    @property
+    def invulnerable_timer(self):
+        return float(self.world.invulnerable_timer[self.index])
+
+    @invulnerable_timer.setter
+    def invulnerable_timer(self, value):
+        self.world.invulnerable_timer[self.index] = value
+
+
+class BallWorld:
+    _fields = ("pos", "velocity", "size", "radius", "color", "invulnerable", "invulnerable_timer",
+               "line_points", "line_count", "line_head", "line_opacity")
+
+    def __init__(self, center, circle_radius, boundary_thickness, gravity, air_resistance, capacity=64, max_collision_lines=128):
+        self.center = np.array(center, dtype='float64')
+        self.circle_radius = circle_radius
+        self.boundary_thickness = boundary_thickness
+        self.gravity = np.array(gravity, dtype='float64')
+        self.air_resistance = air_resistance
+        self.max_collision_lines = max_collision_lines  # Per ball; older collision points are overwritten
+        self.substep_fraction = 0.5  # Longest move per substep, as a share of the ball's radius
+        self.max_substeps = 32
+        self.max_bounces = 8  # Boundary hits resolved per ball per substep
+        self.max_speed = 100000.0  # Keeps runaway modifiers (Shrink_on_bounce speeds a ball up every bounce) finite
+        self.count = 0
+        self.balls = []  # Ball handles, index-aligned with the array rows
+        self.capacity = 0
+        self._grow(capacity)
+
+    def _grow(self, capacity):
+        old_count = self.count
+        arrays = {
+            "pos": np.zeros((capacity, 2), dtype='float64'),
+            "velocity": np.zeros((capacity, 2), dtype='float64'),
+            "size": np.zeros(capacity, dtype='float64'),
+            "radius": np.zeros(capacity, dtype='float64'),
+            "color": np.zeros((capacity, 3), dtype='uint8'),
+            "invulnerable": np.zeros(capacity, dtype=bool),
+            "invulnerable_timer": np.zeros(capacity, dtype='float64'),
+            # Ring buffer of collision points per ball, all sharing one opacity
+            "line_points": np.zeros((capacity, self.max_collision_lines, 2), dtype='float64'),
+            "line_count": np.zeros(capacity, dtype='int32'),
+            "line_head": np.zeros(capacity, dtype='int32'),
+            "line_opacity": np.zeros(capacity, dtype='float64'),
+        }
+        for name, array in arrays.items():
+            if self.capacity:
+                array[:old_count] = getattr(self, name)[:old_count]
+            setattr(self, name, array)
+        self.capacity = capacity
+
+    def add(self, x, y, size, color, velocity, invulnerable_time=999999999):
+        if self.count == self.capacity:
+            self._grow(self.capacity * 2)
+        i = self.count
+        self.pos[i] = (x, y)
+        self.velocity[i] = velocity
+        self.size[i] = size
+        self.radius[i] = size // 2
+        self.color[i] = tuple(color)[:3]
+        self.invulnerable[i] = True
+        self.invulnerable_timer[i] = invulnerable_time
+        self.line_count[i] = 0
+        self.line_head[i] = 0
+        self.line_opacity[i] = 255
+        self.count += 1
+        ball = Ball(self, i)
+        self.balls.append(ball)
+        return ball
+
+    def snapshot(self):
+        """Copy of every ball's state, enough to rebuild this world with from_snapshot."""
+        state = {name: getattr(self, name)[:self.count].copy() for name in self._fields}
+        state.update(
+            center=self.center.copy(),
+            circle_radius=self.circle_radius,
+            boundary_thickness=self.boundary_thickness,
+            gravity=self.gravity.copy(),
+            air_resistance=self.air_resistance,
+            max_collision_lines=self.max_collision_lines,
+        )
+        return state
+
+    @classmethod
+    def from_snapshot(cls, state):
+        count = len(state["pos"])
+        world = cls(state["center"], state["circle_radius"], state["boundary_thickness"], state["gravity"],
+                    state["air_resistance"], capacity=max(count, 1), max_collision_lines=state["max_collision_lines"])
+        for name in cls._fields:
+            getattr(world, name)[:count] = state[name]
+        world.count = count
+        world.balls = [Ball(world, i) for i in range(count)]
+        return world
+
+    def remove(self, indices):
+        """Remove the given rows in one pass, keeping the remaining balls in order."""
+        if len(indices) == 0:
+            return
+        keep = np.ones(self.count, dtype=bool)
+        keep[np.asarray(indices, dtype=np.intp)] = False
+        new_count = int(keep.sum())
+        for name in self._fields:
+            array = getattr(self, name)
+            array[:new_count] = array[:self.count][keep]
+        self.balls = [ball for ball, kept in zip(self.balls, keep) if kept]
+        for i, ball in enumerate(self.balls):
+            ball.index = i
+        self.count = new_count
+
+    def step(self, dt):
+        """Advance every ball by dt.
+
+        Balls that would move further than substep_fraction of their radius
+        in one go are split into equal substeps (at most max_substeps), so a
+        long frame does not flatten their arc; the rest take a single step.
+        Within a (sub)step each ball travels in a straight line and the exact
+        time it reaches the boundary is solved for, so fast balls cannot
+        tunnel through it and bounce as often as they really would.
+
+        Returns the indices of the balls that hit the boundary this step and
+        the matching collision points on the boundary, in the order the hits
+        happened; a ball can appear more than once.
+        """
+        n = self.count
+        if n == 0:
+            return np.empty(0, dtype=np.intp), np.empty((0, 2), dtype='float64')
+
+        velocity = self.velocity[:n]
+        allowed = np.maximum(self.radius[:n] * self.substep_fraction, 1.0)  # Longest move per substep
+        next_velocity = velocity + self.gravity * dt
+        travel = np.einsum('ij,ij->i', next_velocity, next_velocity) * (dt * dt)
+
+        hits = []
+        points = []
+        if travel.max() <= allowed.min() ** 2:
+            self._advance(slice(0, n), dt, 1, hits, points)
+        else:
+            too_fast = np.flatnonzero(travel > (self.max_speed * dt) ** 2)
+            if too_fast.size:
+                velocity[too_fast] *= (self.max_speed * dt / np.sqrt(travel[too_fast]))[:, None]
+                travel[too_fast] = (self.max_speed * dt) ** 2
+            substeps = np.clip(np.ceil(np.sqrt(travel) / allowed), 1, self.max_substeps).astype(np.int64)
+            substeps[self.radius[:n] >= self.circle_radius - self.boundary_thickness / 2] = 1  # Pinned; see _trace
+            rows = np.arange(n)
+            for substep in range(int(substeps.max())):
+                if substep:
+                    rows = rows[substeps[rows] > substep]
+                self._advance(rows, (dt / substeps[rows])[:, None], (1 / substeps[rows])[:, None], hits, points)
+
+        invulnerable = self.invulnerable[:n]
+        timer = self.invulnerable_timer[:n]
+        np.subtract(timer, dt, out=timer, where=invulnerable)
+        invulnerable &= timer > 0
+
+        if not hits:
+            return np.empty(0, dtype=np.intp), np.empty((0, 2), dtype='float64')
+        return np.concatenate(hits), np.concatenate(points)
+
+    def _advance(self, rows, h, fraction, hits, points):
+        """Integrate the given rows by time h, bouncing off the boundary at the exact time of impact.
+
+        rows is a slice or an index array; h is a scalar or an (n, 1)
+        column of per-row times. fraction is the share of a whole step that
+        h represents, so air resistance adds up to the same per-step loss
+        however a step is split.
+        """
+        velocity = self.velocity[rows]
+        velocity += self.gravity * h
+        velocity *= self.air_resistance ** fraction
+        pos = self.pos[rows]
+        pos += velocity * h
+
+        limit = self.circle_radius - self.boundary_thickness / 2
+        reach = np.maximum(limit - self.radius[rows], 0.0)  # Distance from the center the ball's center may go
+        offset = pos - self.center
+        # The arena is convex, so a straight move that ends inside it never touched the boundary
+        moving = np.flatnonzero(np.einsum('ij,ij->i', offset, offset) > reach * reach)
+        if moving.size:
+            # Rewind just the balls that ended up outside and trace them through their bounces
+            ids = np.arange(rows.start, rows.stop)[moving] if isinstance(rows, slice) else rows[moving]
+            v = velocity[moving]
+            remaining = np.broadcast_to(h, (len(offset), 1))[moving, 0].copy()
+            d, v = self._trace(offset[moving] - v * remaining[:, None], v, remaining, reach[moving], limit, ids, hits, points)
+            pos[moving] = self.center + d
+            velocity[moving] = v
+
+        if not isinstance(rows, slice):
+            self.velocity[rows] = velocity
+            self.pos[rows] = pos
+
+    def _trace(self, d, v, remaining, reach, limit, ids, hits, points):
+        """Move balls at offsets d from the center for their remaining time, reflecting off the boundary.
+
+        Returns the final offsets and velocities; every bounce is appended
+        to hits and points.
+        """
+        final_d = np.empty_like(d)
+        final_v = np.empty_like(v)
+        active = np.arange(len(d))
+        # A ball as wide as the arena is pinned to the center; it touches the boundary once, instead of bouncing
+        # max_bounces times in no time at all
+        pinned = reach <= 0
+        if pinned.any():
+            normal = self._normals(d[pinned] + v[pinned] * remaining[pinned, None])
+            final_d[active[pinned]] = 0.0
+            final_v[active[pinned]] = v[pinned] - 2 * (v[pinned] * normal).sum(1)[:, None] * normal
+            hits.append(ids[pinned])
+            points.append(self.center + normal * limit)
+            if pinned.all():
+                return final_d, final_v
+            free = ~pinned
+            active, d, v, remaining, reach, ids = (value[free] for value in (active, d, v, remaining, reach, ids))
+
+        # Balls that started past the boundary (a modifier grew them, say) are put back on it first
+        outside = (d * d).sum(1) > reach * reach
+        if outside.any():
+            normal = self._normals(d[outside])
+            d[outside] = normal * reach[outside, None]
+            moving_out = (v[outside] * normal).sum(1) > 0
+            if moving_out.any():
+                which = np.flatnonzero(outside)[moving_out]
+                normal = normal[moving_out]
+                v[which] -= 2 * (v[which] * normal).sum(1)[:, None] * normal
+                hits.append(ids[which])
+                points.append(self.center + normal * limit)
+
+        for _ in range(self.max_bounces):
+            end = d + v * remaining[:, None]
+            settled = (end * end).sum(1) <= reach * reach * (1 + 1e-12)
+            if settled.any():
+                final_d[active[settled]] = end[settled]
+                final_v[active[settled]] = v[settled]
+                if settled.all():
+                    return final_d, final_v
+                bouncing = ~settled
+                active, d, v, remaining, reach, ids = (
+                    value[bouncing] for value in (active, d, v, remaining, reach, ids))
+
+            # Every ball left ends its move outside, so it meets the boundary at the larger root of |d + v t| = reach
+            a = (v * v).sum(1)
+            b = 2 * (d * v).sum(1)
+            c = np.minimum((d * d).sum(1) - reach * reach, 0.0)
+            root = np.sqrt(b * b - 4 * a * c)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                # Whichever form avoids cancellation
+                impact = np.where(b <= 0, (-b + root) / (2 * a), (2 * c) / (-b - root))
+            stalled = ~(impact > 0)  # Also catches NaN
+            if stalled.any():
+                # No time passes before the next hit, so bouncing again would only repeat it; stop where it is
+                final_d[active[stalled]] = d[stalled]
+                final_v[active[stalled]] = v[stalled]
+                if stalled.all():
+                    return final_d, final_v
+                moved = ~stalled
+                active, d, v, remaining, reach, ids, impact = (
+                    value[moved] for value in (active, d, v, remaining, reach, ids, impact))
+            impact = np.minimum(impact, remaining)
+            d += v * impact[:, None]
+            remaining -= impact
+            normal = self._normals(d)
+            d = normal * reach[:, None]
+            v -= 2 * (v * normal).sum(1)[:, None] * normal
+            hits.append(ids)
+            points.append(self.center + normal * limit)
+
+        # Out of bounces for this substep; finish the move and keep the ball inside
+        d += v * remaining[:, None]
+        distance = np.hypot(d[:, 0], d[:, 1])
+        d *= (np.minimum(distance, reach) / np.maximum(distance, 1e-12))[:, None]
+        final_d[active] = d
+        final_v[active] = v
+        return final_d, final_v
+
+    @staticmethod
+    def _normals(offset):
+        # A ball sitting exactly on the center has no direction; push it straight down
+        distance = np.hypot(offset[:, 0], offset[:, 1])
+        normal = np.where(distance[:, None] > 0, offset, (0.0, 1.0))
+        return normal / np.hypot(normal[:, 0], normal[:, 1])[:, None]
+
+    def record_collision_points(self, indices, points):
+        """Append one collision point per entry of indices to that ball's ring buffer.
+
+        A ball may appear more than once; its points are stored in order.
+        """
+        if len(indices) == 0:
+            return
+        indices = np.asarray(indices, dtype=np.intp)
+        order = np.argsort(indices, kind='stable')
+        indices = indices[order]
+        points = np.asarray(points, dtype='float64')[order]
+        balls, first, counts = np.unique(indices, return_index=True, return_counts=True)
+        rank = np.arange(len(indices)) - np.repeat(first, counts)  # Position among the same ball's points
+
+        slots = (self.line_head[indices] + rank) % self.max_collision_lines
+        self.line_points[indices, slots] = points
+        self.line_head[balls] = (self.line_head[balls] + counts) % self.max_collision_lines
+        self.line_count[balls] = np.minimum(self.line_count[balls] + counts, self.max_collision_lines)
+        self.line_opacity[balls] = 255
+
+    def fade_collision_lines(self, dt, rate=255, floor=90):
+        opacity = self.line_opacity[:self.count]
+        np.maximum(opacity - dt * rate, floor, out=opacity)
+
+    def collision_points(self, index):
+        count = self.line_count[index]
+        slots = (self.line_head[index] - count + np.arange(count)) % self.max_collision_lines
+        return self.line_points[index, slots]
+
+    def find_collisions(self):
+        """Return the indices of balls removed by ball-ball collisions.
+
+        Matches the original list walk: each vulnerable ball, in order, is
+        paired with the first later ball it overlaps that has not already
+        been removed, and both are removed. Candidate pairs come from a
+        uniform grid sized from the largest radius, so only neighbouring
+        balls reach the distance test.
+        """
+        n = self.count
+        vulnerable = ~self.invulnerable[:n]
+        if n < 2 or not vulnerable.any():
+            return np.empty(0, dtype=np.intp)
+
+        first, second = self._candidate_pairs(np.flatnonzero(vulnerable))
+        if first.size == 0:
+            return np.empty(0, dtype=np.intp)
+
+        pos = self.pos[:n]
+        radius = self.radius[:n]
+        offset = pos[first] - pos[second]
+        reach = radius[first] + radius[second]
+        hit = np.einsum('ij,ij->i', offset, offset) < reach * reach
+        first, second = first[hit], second[hit]
+
+        order = np.lexsort((second, first))
+        removed = np.zeros(n, dtype=bool)
+        for a, b in zip(first[order].tolist(), second[order].tolist()):
+            if removed[a] or removed[b]:
+                continue
+            removed[a] = removed[b] = True
+        return np.flatnonzero(removed)
+
+    def _candidate_pairs(self, sources):
+        """Pairs (a, b) with a in sources, b > a, and b in a neighbouring grid cell."""
+        n = self.count
+        pos = self.pos[:n]
+        cell_size = max(2 * float(self.radius[:n].max()), 1.0)
+
+        cells = np.floor(pos / cell_size).astype(np.int64)
+        cells -= cells.min(axis=0) - 1  # Keep neighbour offsets from wrapping into another column
+        stride = int(cells[:, 1].max()) + 2
+        keys = cells[:, 0] * stride + cells[:, 1]
+
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        source_keys = keys[sources]
+
+        firsts = []
+        seconds = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                neighbour_keys = source_keys + dx * stride + dy
+                left = np.searchsorted(sorted_keys, neighbour_keys, side='left')
+                right = np.searchsorted(sorted_keys, neighbour_keys, side='right')
+                counts = right - left
+                total = int(counts.sum())
+                if total == 0:
+                    continue
+                starts = np.repeat(left - np.cumsum(counts) + counts, counts)
+                candidates = order[starts + np.arange(total)]
+                owners = np.repeat(sources, counts)
+                later = candidates > owners
+                firsts.append(owners[later])
+                seconds.append(candidates[later])
+
+        if not firsts:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+        return np.concatenate(firsts), np.concatenate(seconds)
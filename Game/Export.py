@@ -0,0 +1,233 @@
+"""Offline video export.
+
+Runs the simulation with a fixed timestep and renders every frame offscreen
+at any resolution and frame rate, without a window and without dropping
+frames. Each frame is reduced to a compact snapshot of the ball, particle
+and collision-line arrays, and a process pool rasterizes the snapshots in
+parallel. Frames stream in order to an ffmpeg pipe, or to a numbered image
+sequence when the output contains a % pattern. The MIDI notes the bounces
+trigger are rendered offline and muxed into the video, or written next to
+an image sequence as audio.wav:
+
+    python Export.py demo.mp4 --width 1920 --height 1080 --fps 60 --duration 20 --balls 8
+    python Export.py frames/frame_%05d.png --fps 30 --duration 5
+"""
+import argparse
+import colorsys
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import types
+import wave
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from Audio import BounceTrack, MidiIndex, SAMPLE_RATE, load_game_midi
+from Engine import BallWorld
+from Modifiers import load_modifiers
+from Particles import ParticlePool
+from Simulation import Simulation, check_modifier_names
+
+GAME_SIZE = 720  # The simulation's native window size, in pixels
+
+_worker = {}
+
+
+def boundary_color(t, change_hue=True):
+    """The hue-cycling boundary colour of the live game at time t."""
+    if not change_hue:
+        return (255, 255, 255)
+    r, g, b = colorsys.hsv_to_rgb(((t * 10) % 360) / 360, 1, 1)
+    return (round(r * 255), round(g * 255), round(b * 255))
+
+
+def frame_snapshot(simulation, change_hue=True):
+    return {
+        "world": simulation.world.snapshot(),
+        "particles": simulation.particles.snapshot(),
+        "show_lines": simulation.show_lines,
+        "boundary_color": boundary_color(simulation.time, change_hue),
+    }
+
+
+def _scale_state(state, scale, offset):
+    """Map a snapshot from game pixels to output pixels in place."""
+    world = state["world"]
+    world["pos"] = world["pos"] * scale + offset
+    world["radius"] = world["radius"] * scale
+    world["line_points"] = world["line_points"] * scale + offset
+    world["center"] = world["center"] * scale + offset
+    world["circle_radius"] = int(round(world["circle_radius"] * scale))
+    world["boundary_thickness"] = max(int(round(world["boundary_thickness"] * scale)), 1)
+    particles = state["particles"]
+    particles["pos"] = particles["pos"] * scale + offset
+    particles["radius"] = particles["radius"] * scale
+
+
+def _init_worker(width, height, image_pattern):
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    import pygame
+    from Rendering import Renderer, SpriteCache
+
+    pygame.display.init()
+    pygame.display.set_mode((1, 1))  # Needed for convert_alpha in the sprite cache
+    _worker["pygame"] = pygame
+    _worker["surface"] = pygame.Surface((width, height))
+    _worker["renderer"] = Renderer((width, height), SpriteCache(128 * 1024 * 1024))
+    _worker["scale"] = min(width, height) / GAME_SIZE
+    _worker["offset"] = np.array([(width - GAME_SIZE * _worker["scale"]) / 2, (height - GAME_SIZE * _worker["scale"]) / 2])
+    _worker["image_pattern"] = image_pattern
+
+
+def _render_frame(job):
+    index, state = job
+    pygame = _worker["pygame"]
+    _scale_state(state, _worker["scale"], _worker["offset"])
+    world = BallWorld.from_snapshot(state["world"])
+    scene = types.SimpleNamespace(
+        world=world,
+        particles=ParticlePool.from_snapshot(state["particles"]),
+        center=world.center,
+        circle_radius=world.circle_radius,
+        boundary_thickness=world.boundary_thickness,
+        show_lines=state["show_lines"],
+    )
+    surface = _worker["surface"]
+    _worker["renderer"].draw(surface, scene, state["boundary_color"])
+    if _worker["image_pattern"]:
+        pygame.image.save(surface, _worker["image_pattern"] % index)
+        return None
+    return pygame.image.tostring(surface, "RGB")  # tobytes only exists from pygame 2.1.3; 2.1.0 is pinned
+
+
+def simulate(simulation, frames, fps, substeps, spawn_every, change_hue, bounce_times):
+    """Yield (frame index, snapshot) for every frame, recording bounce times as it goes."""
+    dt = 1 / (fps * substeps)
+    next_spawn = spawn_every
+    for index in range(frames):
+        yield index, frame_snapshot(simulation, change_hue)
+        for _ in range(substeps):
+            if spawn_every and simulation.time >= next_spawn:
+                simulation.spawn_ball()
+                next_spawn += spawn_every
+            bounced = simulation.step(dt)
+            bounce_times.extend([simulation.time] * len(bounced))
+
+
+def write_wav(path, samples):
+    with wave.open(path, "wb") as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(samples.tobytes())
+
+
+def main(argv=None):
+    modifiers = load_modifiers()
+    parser = argparse.ArgumentParser(description="Render the simulation to a video file or an image sequence.")
+    parser.add_argument("output", help="video file for ffmpeg (e.g. demo.mp4, demo.gif) or an image pattern like frames/frame_%%05d.png")
+    parser.add_argument("--width", type=int, default=1080, help="output width in pixels (default: 1080)")
+    parser.add_argument("--height", type=int, default=1080, help="output height in pixels (default: 1080)")
+    parser.add_argument("--fps", type=int, default=60, help="frames per second (default: 60)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of video (default: 10)")
+    parser.add_argument("--substeps", type=int, default=1, help="simulation steps per frame (default: 1)")
+    parser.add_argument("--balls", type=int, default=1, help="balls at the start (default: 1)")
+    parser.add_argument("--spawn-every", type=float, default=0.0, metavar="SECONDS",
+                        help="add another ball every this many seconds, like pressing Space (default: never)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+    parser.add_argument("--modifier", action="append", default=[], metavar="NAME",
+                        help="enable a modifier by file name; repeat for several (available: %s)" % ", ".join(modifiers))
+    parser.add_argument("--no-hue", action="store_true", help="keep the boundary white instead of cycling its hue")
+    parser.add_argument("--midi", help="MIDI file for the bounce notes (default: the first file in the MIDI folder)")
+    parser.add_argument("--no-audio", action="store_true", help="do not render or mux audio")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="rendering processes (default: one per CPU)")
+    parser.add_argument("--ffmpeg", default="ffmpeg", help="ffmpeg executable (default: ffmpeg)")
+    args = parser.parse_args(argv)
+
+    check_modifier_names(parser, args.modifier, modifiers)
+
+    image_pattern = args.output if "%" in args.output else None
+    if image_pattern:
+        os.makedirs(os.path.dirname(os.path.abspath(image_pattern)), exist_ok=True)
+    elif shutil.which(args.ffmpeg) is None:
+        parser.error(f"{args.ffmpeg} not found; install ffmpeg or export an image sequence instead")
+
+    midi_index = MidiIndex.empty() if args.no_audio else load_game_midi(args.midi)[1]
+
+    simulation = Simulation(seed=args.seed, modifiers=modifiers)
+    simulation.selected_modifiers = list(args.modifier)
+    for _ in range(args.balls):
+        simulation.spawn_ball()
+
+    frames = int(round(args.duration * args.fps))
+    temp_folder = tempfile.mkdtemp(prefix="bouncing-ball-export-")
+    video_path = os.path.join(temp_folder, "video" + os.path.splitext(args.output)[1])
+    encoder = None
+    if not image_pattern:
+        encoder = subprocess.Popen(
+            [args.ffmpeg, "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgb24",
+             "-s", f"{args.width}x{args.height}", "-r", str(args.fps), "-i", "-", "-pix_fmt", "yuv420p", video_path],
+            stdin=subprocess.PIPE)
+
+    bounce_times = []
+    # Mixed while the frames render, so a problem with the notes ends the export before the expensive part
+    track = BounceTrack(midi_index, int(args.duration * SAMPLE_RATE)) if not args.no_audio and len(midi_index) else None
+    mixed = 0
+    try:
+        with ProcessPoolExecutor(args.workers, initializer=_init_worker,
+                                 initargs=(args.width, args.height, image_pattern)) as pool:
+            pending = deque()
+            in_flight = max(args.workers * 4, 1)  # Bounds memory held by rendered but unwritten frames
+            for job in simulate(simulation, frames, args.fps, args.substeps, args.spawn_every, not args.no_hue, bounce_times):
+                pending.append(pool.submit(_render_frame, job))
+                if track:
+                    for when in bounce_times[mixed:]:
+                        track.add(when)
+                    mixed = len(bounce_times)
+                while len(pending) >= in_flight:
+                    frame = pending.popleft().result()
+                    if encoder:
+                        encoder.stdin.write(frame)
+                print(f"\rframe {job[0] + 1}/{frames}", end="", file=sys.stderr)
+            for future in pending:
+                frame = future.result()
+                if encoder:
+                    encoder.stdin.write(frame)
+        print(file=sys.stderr)
+        if encoder:
+            encoder.stdin.close()
+            if encoder.wait() != 0:
+                sys.exit("ffmpeg failed while encoding the video")
+
+        audio_path = None
+        if track:
+            for when in bounce_times[mixed:]:
+                track.add(when)
+            if image_pattern:
+                audio_path = os.path.join(os.path.dirname(os.path.abspath(image_pattern)), "audio.wav")
+            else:
+                audio_path = os.path.join(temp_folder, "audio.wav")
+            write_wav(audio_path, track.samples())
+
+        if not image_pattern:
+            if audio_path and os.path.splitext(args.output)[1].lower() != ".gif":
+                command = [args.ffmpeg, "-y", "-loglevel", "error", "-i", video_path, "-i", audio_path,
+                           "-c:v", "copy", "-shortest", args.output]
+                if subprocess.call(command) != 0:
+                    sys.exit("ffmpeg failed while adding the audio track")
+            else:
+                shutil.move(video_path, args.output)
+    finally:
+        if encoder and encoder.poll() is None:
+            encoder.kill()
+        shutil.rmtree(temp_folder, ignore_errors=True)
+
+    print(f"Wrote {frames} frames, {len(bounce_times)} bounces to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,41 @@
 import os
 import sys
+import time
+
+launch_time = time.perf_counter()  # Time to first frame is measured from here
+
+import queue
+import threading
 import pygame
 import numpy as np
-import importlib
-import random
-import time
 import pygame.gfxdraw
-import mido
+from Audio import AudioScheduler, MidiIndex, NoteCache, load_game_midi
+from Modifiers import ModifierWatcher, load_modifiers
+from Rendering import Renderer, SpriteCache
+from Profiler import profiler
+from Quality import QualityGovernor
+from Replay import Recorder
+from Simulation import Simulation
 
-# Initialize Pygame
-pygame.init()
 screen_width = 720
 screen_height = 720
-screen = pygame.display.set_mode((screen_width, screen_height), pygame.SRCALPHA)
-pygame.display.set_caption("Ball Bouncing Inside a Circle")
-clock = pygame.time.Clock()
 framerate = 60
 
-# Initialize font
-font = pygame.font.Font(None, 36)
+font = None  # Created on first use by get_font
 
-midi_folder = os.path.join(os.path.dirname(__file__), 'MIDI')
-midi_files = [f for f in os.listdir(midi_folder) if f.endswith('.mid')]
 
-midi_notes = []
-if midi_files:
-    midi_path = os.path.join(midi_folder, midi_files[0])
-    mid = mido.MidiFile(midi_path)
-    for msg in mid:
-        if not msg.is_meta and (msg.type == 'note_on' or msg.type == 'note_off'):
-            midi_notes.append(msg)
+def get_font():
+    global font
+    if font is None:
+        pygame.font.init()
+        font = pygame.font.Font(None, 36)
+    return font
+
 
 color = (255, 255, 255)
 hue = 0
 
-show_lines = True
-show_trail = True
 change_hue = True
-show_background_growing_circle = True
-show_collision_growing_circle = True
 
 # Variables for GUI
 selected_modifier = None
@@ -46,31 +43,31 @@ expanded_modifier = None
 click_processed = False  # Initialize click_processed flag
 
 
-current_midi_index = 0
-currently_playing_sounds = []
+note_cache_budget = 64 * 1024 * 1024  # Bytes of synthesized notes to keep ready
+warm_up_note_cache = True  # Render every note of the MIDI file in the background once audio has started
+max_voices = 16  # Notes allowed to sound at once on separate channels; the oldest is cut off beyond this
+use_voice_mixer = True  # Mix every note into one stream instead, so no note is cut off and max_voices does not apply
 
 def sanitize_name(name):
     return ''.join(char for char in name if char.isprintable())
 
-def load_modifiers():
-    modifiers = {}
-    modifiers_folder = os.path.join(os.path.dirname(__file__), 'Modifiers')
-    for filename in os.listdir(modifiers_folder):
-        if filename.endswith('.py') and filename != '__init__.py':
-            module_name = filename[:-3]
-            module = importlib.import_module(f'Modifiers.{module_name}')
-            if hasattr(module, 'modify'):
-                modifiers[module_name] = {
-                    "function": module.modify,
-                    "description": module.__doc__ or "No description available"
-                }
-    return modifiers
-
-modifiers = load_modifiers()
+modifiers = {}  # Filled in by the startup loader thread
 selected_modifiers = []  # No initial selection
 expanded_modifier = None
 
-def wrap_text(surface, text, x, y, max_width, font):
+text_cache = {}  # Rendered text surfaces, keyed by font, text and colours
+
+
+def render_text(font, text, color, background=None):
+    key = (id(font), text, color, background)
+    surface = text_cache.get(key)
+    if surface is None:
+        surface = text_cache[key] = font.render(text, True, color, background)
+    return surface
+
+
+def wrap_text(text, max_width, font):
+    """Split text into lines of rendered words that fit in max_width."""
     words = text.replace('\n', ' ').split(' ')
     space_width, space_height = font.size(' ')
     lines = []
@@ -78,7 +75,7 @@ def wrap_text(surface, text, x, y, max_width, font):
     current_width = 0
 
     for word in words:
-        word_surface = font.render(word, True, (255, 255, 255))
+        word_surface = render_text(font, word, (255, 255, 255))
         word_width, word_height = word_surface.get_size()
         if current_width + word_width <= max_width:
             current_line.append(word_surface)
@@ -89,99 +86,141 @@ def wrap_text(surface, text, x, y, max_width, font):
             current_width = word_width + space_width
 
     lines.append(current_line)
+    return lines
 
-    y_initial = y  # Store the initial y position
-
+def draw_text_lines(surface, lines, x, y, font):
+    space_width, space_height = font.size(' ')
     for line in lines:
+        word_x = x
         for word_surface in line:
-            surface.blit(word_surface, (x, y))
-            x += word_surface.get_width() + space_width
-        x = menu_rect.x + 40  # Reset x position relative to the box
+            surface.blit(word_surface, (word_x, y))
+            word_x += word_surface.get_width() + space_width
         y += space_height
-
     return y  # Return the new y position without additional spacing
 
-def draw_modifier_menu(screen, font, modifiers, selected_modifiers, expanded_modifier, dragging, drag_offset, minimized):
-    global menu_position
-    
-    title_text = font.render("Modifiers", True, (255, 255, 255))
+class MenuCache:
+    """The modifier menu rendered once at the origin, with its layout.
+
+    It is only re-rendered when the modifiers, the selection, the expanded
+    entry or the minimized state change; moving or dragging the menu just
+    blits the same surface somewhere else.
+    """
+    transparent = (255, 0, 255)
+
+    def __init__(self):
+        self.key = None
+        self.surface = None
+        self.layout = None
+
+    def get(self, font, modifiers, selected_modifiers, expanded_modifier, minimized):
+        key = (id(font), id(modifiers), tuple(modifiers), tuple(selected_modifiers), expanded_modifier, minimized)
+        if key != self.key:
+            self.surface, self.layout = render_modifier_menu(font, modifiers, selected_modifiers, expanded_modifier, minimized)
+            self.key = key
+        return self.surface, self.layout
+
+menu_cache = MenuCache()
+
+def render_modifier_menu(font, modifiers, selected_modifiers, expanded_modifier, minimized):
+    """Draw the menu onto its own surface with the menu's top-left at (0, 0) and return it with the rects."""
+    title_text = render_text(font, "Modifiers", (255, 255, 255))
     title_width = title_text.get_width()
     button_width = 80
     title_and_buttons_width = title_width + button_width + 20
-    max_item_width = max(font.size(sanitize_name(name).replace('_', ' '))[0] for name in modifiers.keys()) + 100
+    max_item_width = max((font.size(sanitize_name(name).replace('_', ' '))[0] for name in modifiers.keys()), default=0) + 100
     menu_width = max(title_and_buttons_width, max_item_width)
-    
-    menu_rect = pygame.Rect(menu_position.x, menu_position.y, menu_width, 620)
-    header_rect = pygame.Rect(menu_position.x, menu_position.y, menu_width, 40)
+
+    menu_rect = pygame.Rect(0, 0, menu_width, 620)
+    header_rect = pygame.Rect(0, 0, menu_width, 40)
+    close_button = pygame.Rect(header_rect.right - 30, header_rect.y + 5, 20, 20)
+    minimize_button = pygame.Rect(header_rect.right - 60, header_rect.y + 5, 20, 20)
     item_rects = []
     triangle_rects = []
 
-    if dragging:
-        menu_rect.topleft = pygame.Vector2(pygame.mouse.get_pos()) - drag_offset
-        header_rect.topleft = menu_rect.topleft
-
+    # Lay the entries out first so the surface can be sized to fit them
+    items = []
+    bottom = header_rect.bottom
     if not minimized:
-        pygame.draw.rect(screen, (0, 0, 0), menu_rect)
-        pygame.draw.rect(screen, (100, 100, 100, 128), menu_rect)
+        y_offset = header_rect.height + 10
+        buffer = 10
+        space_height = font.size(' ')[1]
+
+        for i, (name, data) in enumerate(modifiers.items()):
+            display_name = sanitize_name(name).replace('_', ' ')
+            text_width, text_height = font.size(display_name)
+            text_width += buffer * 2
+            item_rect = pygame.Rect(menu_rect.x + 20, menu_rect.y + y_offset, text_width, 30)
+
+            triangle_x = menu_rect.x + text_width + 40  # Adjusted value to add gap
+            triangle_y = menu_rect.y + y_offset + 10
+            triangle_points = [(triangle_x, triangle_y),
+                               (triangle_x + 10, triangle_y + 10),
+                               (triangle_x - 10, triangle_y + 10)]
+            if expanded_modifier == name:
+                triangle_points = [(triangle_x, triangle_y + 10),
+                                   (triangle_x + 10, triangle_y),
+                                   (triangle_x - 10, triangle_y)]
+
+            triangle_rects.append((pygame.Rect(triangle_x - 10, triangle_y - 10, 20, 20), name))
+            item_rects.append((item_rect, name))
+            text_position = (menu_rect.x + 20 + buffer, menu_rect.y + y_offset)
+            y_offset += 40
+
+            description = None
+            if expanded_modifier == name:
+                description = (wrap_text(data["description"], menu_width - 80, font), (menu_rect.x + 40, menu_rect.y + y_offset))
+                y_offset += len(description[0]) * space_height + 10
+            items.append((name, display_name, item_rect, text_position, triangle_points, description))
+        bottom = max(menu_rect.bottom, menu_rect.y + y_offset)
+
+    surface = pygame.Surface((menu_width, bottom)).convert()
+    if bottom > menu_rect.bottom and not minimized:
+        # Descriptions run past the panel; keep the area beside them see-through
+        surface.fill(MenuCache.transparent)
+        surface.set_colorkey(MenuCache.transparent)
 
-    pygame.draw.rect(screen, (150, 150, 150, 128), header_rect)
-
-    header_text = font.render("Modifiers", True, (255, 255, 255))
-    screen.blit(header_text, (header_rect.x + 10, header_rect.y + 10))
+    if not minimized:
+        pygame.draw.rect(surface, (0, 0, 0), menu_rect)
+        pygame.draw.rect(surface, (100, 100, 100, 128), menu_rect)
 
-    close_button = pygame.Rect(header_rect.right - 30, header_rect.y + 5, 20, 20)
-    minimize_button = pygame.Rect(header_rect.right - 60, header_rect.y + 5, 20, 20)
-    pygame.draw.rect(screen, (200, 0, 0), close_button)
-    pygame.draw.rect(screen, (200, 200, 0), minimize_button)
-    close_text = font.render("X", True, (255, 255, 255))
-    minimize_text = font.render("-", True, (255, 255, 255))
-    screen.blit(close_text, (close_button.x + 5, close_button.y))
-    screen.blit(minimize_text, (minimize_button.x + 5, minimize_button.y))
+    pygame.draw.rect(surface, (150, 150, 150, 128), header_rect)
+    surface.blit(title_text, (header_rect.x + 10, header_rect.y + 10))
 
-    if minimized:
-        return menu_rect, header_rect, close_button, minimize_button, item_rects, triangle_rects
+    pygame.draw.rect(surface, (200, 0, 0), close_button)
+    pygame.draw.rect(surface, (200, 200, 0), minimize_button)
+    surface.blit(render_text(font, "X", (255, 255, 255)), (close_button.x + 5, close_button.y))
+    surface.blit(render_text(font, "-", (255, 255, 255)), (minimize_button.x + 5, minimize_button.y))
 
-    y_offset = header_rect.height + 10
-    buffer = 10
+    for name, display_name, item_rect, text_position, triangle_points, description in items:
+        background_color = (0, 255, 0, 128) if name in selected_modifiers else (50, 50, 50, 0)
+        pygame.draw.rect(surface, background_color, item_rect)
+        text_surface = render_text(font, display_name, (255, 255, 255), (0, 0, 0))
+        text_surface.set_colorkey((0, 0, 0))
+        surface.blit(text_surface, text_position)
+        pygame.draw.polygon(surface, (255, 255, 255), triangle_points)
+        if description is not None:
+            lines, (x, y) = description
+            draw_text_lines(surface, lines, x, y, font)
 
-    for i, (name, data) in enumerate(modifiers.items()):
-        display_name = sanitize_name(name).replace('_', ' ')
-        is_selected = name in selected_modifiers
-        background_color = (0, 255, 0, 128) if is_selected else (50, 50, 50, 0)
+    return surface, (menu_rect, header_rect, close_button, minimize_button, item_rects, triangle_rects)
 
-        text_surface = font.render(display_name, True, (255, 255, 255), (0, 0, 0))
-        text_surface.set_colorkey((0, 0, 0))
-        text_width, text_height = font.size(display_name)
-
-        text_width += buffer * 2
-        item_rect = pygame.Rect(menu_rect.x + 20, menu_rect.y + y_offset, text_width, 30)
-        pygame.draw.rect(screen, background_color, item_rect)
-
-        if text_surface:
-            screen.blit(text_surface, (menu_rect.x + 20 + buffer, menu_rect.y + y_offset))
-
-        triangle_color = (255, 255, 255)
-        triangle_x = menu_rect.x + text_width + 40  # Adjusted value to add gap
-        triangle_y = menu_rect.y + y_offset + 10
-        triangle_points = [(triangle_x, triangle_y), 
-                           (triangle_x + 10, triangle_y + 10), 
-                           (triangle_x - 10, triangle_y + 10)]
-        if expanded_modifier == name:
-            triangle_points = [(triangle_x, triangle_y + 10), 
-                               (triangle_x + 10, triangle_y), 
-                               (triangle_x - 10, triangle_y)]
-        pygame.draw.polygon(screen, triangle_color, triangle_points)
-        
-        triangle_rect = pygame.Rect(triangle_x - 10, triangle_y - 10, 20, 20)
-        triangle_rects.append((triangle_rect, name))
-        item_rects.append((item_rect, name))
-        y_offset += 40
+def draw_modifier_menu(screen, font, modifiers, selected_modifiers, expanded_modifier, dragging, drag_offset, minimized, draw=True):
+    """Blit the cached menu at its current position and return its rects in screen coordinates.
 
-        if expanded_modifier == name:
-            description_y = menu_rect.y + y_offset
-            y_offset = wrap_text(screen, data["description"], menu_rect.x + 40, description_y, menu_width - 80, font) - menu_rect.y + 10
+    With draw=False only the rects are returned, for hit-testing mouse events.
+    """
+    surface, layout = menu_cache.get(font, modifiers, selected_modifiers, expanded_modifier, minimized)
+    origin = pygame.Vector2(menu_position)
+    if dragging:
+        origin = pygame.Vector2(pygame.mouse.get_pos()) - drag_offset
+    origin = (int(origin.x), int(origin.y))
+    if draw:
+        screen.blit(surface, origin)
 
-    return menu_rect, header_rect, close_button, minimize_button, item_rects, triangle_rects
+    menu_rect, header_rect, close_button, minimize_button, item_rects, triangle_rects = layout
+    return (menu_rect.move(origin), header_rect.move(origin), close_button.move(origin), minimize_button.move(origin),
+            [(rect.move(origin), name) for rect, name in item_rects],
+            [(rect.move(origin), name) for rect, name in triangle_rects])
 
 def toggle_modifier(modifier, selected_modifiers):
     sanitized_modifier = sanitize_name(modifier)
@@ -227,69 +266,6 @@ def handle_triangle_click(event, triangle_rects, expanded_modifier, click_proces
                 break
     return expanded_modifier, click_processed
 
-def apply_modifier(event_name, ball):
-    global selected_modifiers
-    if selected_modifiers:
-        for modifier_name in selected_modifiers:
-            if modifier_name in modifiers:
-                modifier_function = modifiers[modifier_name]["function"]
-                modifier_function(event_name, ball, None)
-
-def adsr_envelope(t, attack, decay, sustain, release):
-    total_samples = len(t)
-    attack_samples = min(int(attack * 44100), total_samples)
-    decay_samples = min(int(decay * 44100), total_samples - attack_samples)
-    release_samples = min(int(release * 44100), total_samples - attack_samples - decay_samples)
-    sustain_samples = total_samples - (attack_samples + decay_samples + release_samples)
-
-    env = np.zeros(total_samples)
-    env[:attack_samples] = np.linspace(0, 1, attack_samples)
-    env[attack_samples:attack_samples + decay_samples] = np.linspace(1, sustain, decay_samples)
-    if sustain_samples > 0:
-        env[attack_samples + decay_samples:attack_samples + decay_samples + sustain_samples] = sustain
-    env[-release_samples:] = np.linspace(sustain, 0, release_samples)
-
-    return env
-
-def play_next_midi_notes():
-    global current_midi_index
-    global currently_playing_sounds
-
-    if current_midi_index >= len(midi_notes):
-        current_midi_index = 0
-
-    notes_to_play = []
-    while current_midi_index < len(midi_notes):
-        msg = midi_notes[current_midi_index]
-        if msg.type == 'note_on':
-            freq = 440.0 * (2.0 ** ((msg.note - 69) / 12.0))
-            duration = int(44100 * msg.time) if msg.time > 0 else 44100
-            t = np.arange(duration) / 44100.0
-            samples = np.sin(2 * np.pi * freq * t).astype(np.float32)
-
-            # Apply ADSR envelope
-            attack = 0.01
-            decay = 0.1
-            sustain = 0.7
-            release = 0.2
-            envelope = adsr_envelope(t, attack, decay, sustain, release)
-            samples *= envelope
-
-            samples_stereo = np.column_stack((samples, samples))
-            samples_stereo *= 0.0125  # Normalize the amplitude
-            sound = pygame.sndarray.make_sound((samples_stereo * 32767).astype(np.int16))
-            notes_to_play.append(sound)
-        elif msg.type == 'note_off':
-            pass
-        current_midi_index += 1
-
-        if len(notes_to_play) > 0 and (current_midi_index >= len(midi_notes) or midi_notes[current_midi_index].time > 0):
-            break
-
-    for sound in notes_to_play:
-        sound.play()
-        currently_playing_sounds.append(sound)
-
 # Constants
 gravity = np.array([0, 300], dtype='float64')  # Gravity vector
 air_resistance = 0.9995  # Air resistance coefficient (1 means no air resistance)
@@ -307,6 +283,7 @@ class Notification:
         self.target_position = None  # Target position will be set later
         self.current_position = self.start_position  # Initial current position
         self.animation_timestamp = time.time()  # Separate timestamp for animation
+        self.text = None
 
     def update(self):
         return (time.time() - self.timestamp) < self.duration
@@ -327,10 +304,12 @@ class Notification:
         self.current_position = (self.start_position[0], self.start_position[1] + (self.target_position[1] - self.start_position[1]) * easing_factor)
 
     def draw(self, screen):
-        text = font.render(self.message, True, (255, 255, 255))
+        if self.text is None:
+            self.text = get_font().render(self.message, True, (255, 255, 255))  # Rendered once, faded with set_alpha
+        text = self.text
         text.set_alpha(self.get_opacity())
         self.update_position()
-        screen.blit(text, self.current_position)
+        return screen.blit(text, self.current_position)
 
 class NotificationManager:
     def __init__(self):
@@ -353,193 +332,28 @@ class NotificationManager:
         self.notifications = [n for n in self.notifications if n.update() and n.current_position[1] > -50]
         
     def draw(self, screen):
-        for notification in self.notifications:
-            notification.draw(screen)
-
-growing_circles = []
-
-class GrowingCircle:
-    def __init__(self, x, y, initial_radius, growth_rate, color, initial_alpha=255, fade_rate=255, layer=1):
-        self.pos = np.array([x, y], dtype='float64')
-        self.radius = initial_radius
-        self.growth_rate = growth_rate
-        self.color = color
-        self.alpha = initial_alpha
-        self.fade_rate = fade_rate  # Rate at which the alpha decreases
-        self.layer = layer
-
-    def update(self, dt):
-        self.radius += self.growth_rate * dt
-        self.alpha -= self.fade_rate * dt
-        self.alpha = max(self.alpha, 0)
-        self.radius = max(self.radius, 0)
-        return self.alpha > 0
+        return [notification.draw(screen) for notification in self.notifications]
 
-    def draw(self, screen):
-        surface = pygame.Surface((self.radius * 2, self.radius * 2), pygame.SRCALPHA)
-        surface = surface.convert_alpha()
-        color_without_alpha = self.color[:3]
-        
-        # Draw filled circle
-        pygame.gfxdraw.filled_circle(surface, int(self.radius), int(self.radius), int(self.radius), color_without_alpha + (int(self.alpha),))
-        
-        
-        # Draw anti-aliased outer edge
-        pygame.gfxdraw.aacircle(surface, int(self.radius), int(self.radius), int(self.radius), color_without_alpha + (int(self.alpha),))
-        
-        # Blit the surface with transparency onto the main screen
-        screen.blit(surface, (self.pos[0] - self.radius, self.pos[1] - self.radius))
-class Ball:
-    def __init__(self, x, y, size, color, velocity):
-        self.pos = np.array([x, y], dtype='float64')
-        self.size = size
-        self.radius = size // 2
-        self.color = color
-        self.velocity = np.array(velocity, dtype='float64')
-        self.invulnerable = True
-        self.invulnerable_timer = 999999999
-        self.has_bounced = False
-        self.collision_points = []
-        self.line_opacities = []
-
-    def update(self, dt, center, circle_radius):
-        self.velocity += gravity * dt
-        self.velocity *= air_resistance
-        self.pos += self.velocity * dt
-        self.check_collision_with_boundary(center, circle_radius)
-        
-        if self.invulnerable:
-            self.invulnerable_timer -= dt
-            if self.invulnerable_timer <= 0:
-                self.invulnerable = False
-                
-        if show_trail:
-            new_circle = GrowingCircle(self.pos[0], self.pos[1], self.radius, -140, self.color, 150, 200)
-            growing_circles.append(new_circle)
-        
-        for i in range(len(self.line_opacities)):
-            self.line_opacities[i] = max(self.line_opacities[i] - dt * 255, 90)
-
-    def check_collision_with_boundary(self, center, circle_radius):
-        to_center = self.pos - center
-        distance_to_center = np.linalg.norm(to_center)
-        if distance_to_center + self.radius > circle_radius - boundary_thickness / 2:
-            normal = to_center / distance_to_center
-            collision_point = center + normal * (circle_radius - boundary_thickness / 2)
-            self.velocity -= 2 * np.dot(self.velocity, normal) * normal
-            self.pos = center + normal * (circle_radius - boundary_thickness / 2 - self.radius)
-            self.on_collision(collision_point)
-            
-    def on_collision(self, collision_point):
-        if show_lines:
-            self.collision_points.append(collision_point)
-            self.line_opacities.append(255)
-            self.line_opacities = [255 for _ in self.line_opacities]
-
-        if show_collision_growing_circle:
-            new_circle = GrowingCircle(collision_point[0], collision_point[1], 25, 10, self.color)
-            growing_circles.append(new_circle)
-        
-        if show_background_growing_circle:
-            background_circle = GrowingCircle(center[0], center[1], circle_radius + (boundary_thickness / 2), 25, self.color, layer=0)
-            growing_circles.append(background_circle)
-        
-        play_next_midi_notes()
-
-        # Apply modifier for ball bounce event
-        apply_modifier("ball_bounce", self)
-
-    def draw(self, screen):
-        surface = pygame.Surface((screen_width, screen_height), pygame.SRCALPHA)
-        
-        if show_lines:
-            for idx, point in enumerate(self.collision_points):
-                color_with_opacity = (*self.color[:3], int(self.line_opacities[idx]))  # Ensure it's an RGBA tuple
-                direction = np.array(self.pos) - np.array(point)
-                direction_length = np.linalg.norm(direction)
-                if direction_length > 5:  # Avoid division by zero or negative length
-                    direction = direction / direction_length  # Normalize the direction
-                    
-                    # Calculate the normal at the collision point
-                    normal = point - center
-                    normal_length = np.linalg.norm(normal)
-                    if normal_length > 0:
-                        normal = normal / normal_length  # Normalize the normal vector
-
-                        # Calculate the angle between the direction and the normal
-                        dot_product = np.dot(direction, normal)
-                        dot_product = np.clip(dot_product, -1.0, 1.0)  # Clip dot product to valid range for arccos
-                        angle = np.arccos(dot_product)  # Angle in radians
-                        
-                        # Shorten the line more as the angle increases
-                        shorten_factor = 5 + 2 * (angle / np.pi)
-                        new_point = np.array(point) + direction * shorten_factor
-                        pygame.draw.line(surface, color_with_opacity, (int(new_point[0]), int(new_point[1])), (int(self.pos[0]), int(self.pos[1])), 1)
-        
-        pygame.draw.circle(surface, self.color, (int(self.pos[0]), int(self.pos[1])), self.radius)
-        pygame.draw.circle(surface, self.color, (int(self.pos[0]), int(self.pos[1])), self.radius, 1)
-        pygame.draw.circle(surface, (0, 0, 0), (int(self.pos[0]), int(self.pos[1])), int((4 * self.radius) / 5))
-        
-        screen.blit(surface, (0, 0))
-
-def get_random_velocity():
-    angle = random.uniform(0, 2 * np.pi)
-    speed = random.uniform(100, 1000)
-    return np.array([speed * np.cos(angle), speed * np.sin(angle)], dtype='float64')
-
-def check_ball_collisions():
-    global balls
-    new_balls = []
-    while balls:
-        ball = balls.pop(0)
-        if not ball.invulnerable:
-            collided = False
-            for other_ball in balls:
-                if np.linalg.norm(ball.pos - other_ball.pos) < ball.radius + other_ball.radius:
-                    collided = True
-                    balls.remove(other_ball)
-                    break
-            if not collided:
-                new_balls.append(ball)
-        else:
-            new_balls.append(ball)
-    balls = new_balls
-
-def get_random_color():
-    hue = random.randint(0, 360)
-    color = pygame.Color(0)
-    color.hsva = (hue, 100, 100, 100)
-    return color
+max_particles = 8192  # Oldest growing circles are evicted first once the pool is full
+sprite_memory_budget = 64 * 1024 * 1024  # Bytes of pre-rendered circle sprites to keep
+use_shared_overlay = True  # Draw every ball into one reusable layer instead of a full-screen surface each
+use_dirty_rects = True  # Only redraw and push the parts of the screen that changed
+full_update_fraction = 0.5  # Flip the whole screen once more than this share of it changed
+use_ripple_renderer = True  # Draw all background ripples in one pass from a cached distance map
+slow_modifier_load = 1.0  # Seconds; slower modifier imports are reported
+use_quality_governor = True  # Shed effects automatically when frames take longer than 1 / framerate
 
 center = np.array([screen_width // 2, screen_height // 2], dtype='float64')
 circle_radius = 300
-balls = []  # Initialize an empty list for balls
-
-notification_manager = NotificationManager()
-
-if midi_files:
-    notification_manager.add_notification(f"MIDI file found: {midi_files[0]}")
-else:
-    notification_manager.add_notification("No MIDI file found")
-
-selected_modifier = list(modifiers.keys())[0] if modifiers else None
-dragging = False
-drag_offset = pygame.Vector2(0, 0)
-
+max_collision_lines = 128  # Collision lines remembered per ball; the oldest are dropped first
 
 # Initialize color and hue
 hue = 0
 change_hue = True  # Variable to toggle hue-changing
 
-# Toggle features
-show_lines = True
-show_trail = True
-show_background_growing_circle = True
-show_collision_growing_circle = True
 
+profiler_phases = ("input", "physics", "ball collisions", "particles", "draw", "menu", "notifications", "flip")
 
-# Main loop
-running = True
 menu_open = False
 menu_minimized = False
 
@@ -549,85 +363,216 @@ close_button = pygame.Rect(header_rect.right - 30, header_rect.y + 5, 20, 20)
 minimize_button = pygame.Rect(header_rect.right - 60, header_rect.y + 5, 20, 20)
 
 
-while running:
-    dt = clock.tick(framerate) / 1000.0
-    click_processed = False  # Reset click_processed at the start of each frame
-
-    if change_hue:
-        hue = (hue + dt * 10) % 360
-        color = pygame.Color(0)
-        color.hsva = (hue, 100, 100, 100)
-    else:
-        color = pygame.Color(255, 255, 255)
-
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-        elif event.type == pygame.KEYDOWN:
-            if event.key == pygame.K_SPACE:
-                new_ball = Ball(center[0], center[1], ball_size, get_random_color(), get_random_velocity())
-                balls.append(new_ball)
-            elif event.key == pygame.K_m:
-                menu_open = not menu_open
-                menu_minimized = False
-            elif event.key == pygame.K_1:
-                show_lines = not show_lines
-                notification_manager.add_notification(f"Show lines turned {'on' if show_lines else 'off'}")
-            elif event.key == pygame.K_2:
-                show_trail = not show_trail
-                notification_manager.add_notification(f"Show trail turned {'on' if show_trail else 'off'}")
-            elif event.key == pygame.K_3:
-                change_hue = not change_hue
-                notification_manager.add_notification(f"Change hue turned {'on' if change_hue else 'off'}")
-            elif event.key == pygame.K_4:
-                show_background_growing_circle = not show_background_growing_circle
-                notification_manager.add_notification(f"Show background reactive circle turned {'on' if show_background_growing_circle else 'off'}")
-            elif event.key == pygame.K_5:
-                show_collision_growing_circle = not show_collision_growing_circle
-                notification_manager.add_notification(f"Show collision circle turned {'on' if show_collision_growing_circle else 'off'}")
-        elif event.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP, pygame.MOUSEMOTION):
-            # Define triangle_rects before usage
-            triangle_rects = []
-            menu_rect, header_rect, close_button, minimize_button, item_rects, triangle_rects = draw_modifier_menu(screen, font, modifiers, selected_modifiers, expanded_modifier, dragging, drag_offset, menu_minimized)
-            dragging, drag_offset, click_processed = handle_mouse_events(event, menu_rect, header_rect, close_button, minimize_button, dragging, drag_offset, click_processed)
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                for item_rect, modifier_name in item_rects:
-                    if item_rect.collidepoint(event.pos):
-                        toggle_modifier(modifier_name, selected_modifiers)
-                        click_processed = True
-                expanded_modifier, click_processed = handle_triangle_click(event, triangle_rects, expanded_modifier, click_processed)
-
-    for ball in balls:
-        ball.update(dt, center, circle_radius)
-
-    check_ball_collisions()
-
-    growing_circles = [circle for circle in growing_circles if circle.update(dt) and circle.radius > 0]
-
-    screen.fill((0, 0, 0))
-
-    for circle in sorted(growing_circles, key=lambda c: c.layer):
-        if circle.layer == 0:
-            circle.draw(screen)
-
-    pygame.gfxdraw.filled_circle(screen, int(center[0]), int(center[1]), circle_radius + int(boundary_thickness / 2), color)
-    pygame.gfxdraw.aacircle(screen, int(center[0]), int(center[1]), circle_radius + int(boundary_thickness / 2), color)
-
-    pygame.gfxdraw.filled_circle(screen, int(center[0]), int(center[1]), circle_radius - boundary_thickness, (0, 0, 0))
-    pygame.gfxdraw.aacircle(screen, int(center[0]), int(center[1]), circle_radius - boundary_thickness, (0, 0, 0))
-    for circle in growing_circles:
-        if circle.layer != 0:
-            circle.draw(screen)
-        
-    for ball in balls:
-        ball.draw(screen)
-
-    if menu_open:
-        menu_rect, header_rect, close_button, minimize_button, item_rects, triangle_rects = draw_modifier_menu(screen, font, modifiers, selected_modifiers, expanded_modifier, dragging, drag_offset, menu_minimized)
-
-    notification_manager.update()
-    notification_manager.draw(screen)
-    pygame.display.flip()
-
-pygame.quit()
-sys.exit()
\ No newline at end of file
+def load_in_background(results):
+    """Startup work that can wait until the window is up; every outcome is posted to results."""
+    try:
+        errors = []
+        results.put(("modifiers", load_modifiers(errors)))
+        for name, message in errors:
+            results.put(("error", f"Could not load modifier {name}: {message}"))
+    except Exception as error:
+        results.put(("error", f"Could not load modifiers: {error}"))
+
+    try:
+        midi_path, midi_index = load_game_midi()
+        results.put(("midi", midi_path and os.path.basename(midi_path), midi_index))
+    except Exception as error:
+        results.put(("error", f"Could not load MIDI file: {error}"))
+    results.put(("done",))
+
+
+def main():
+    global modifiers, menu_open, menu_minimized, expanded_modifier, menu_position, menu_rect, header_rect, triangle_rects
+    global color, hue, change_hue
+
+    # Only the display is initialized up front; fonts and the mixer start on first use
+    pygame.display.init()
+    screen = pygame.display.set_mode((screen_width, screen_height), pygame.SRCALPHA)
+    pygame.display.set_caption("Ball Bouncing Inside a Circle")
+    clock = pygame.time.Clock()
+
+    sprite_cache = SpriteCache(sprite_memory_budget)
+    renderer = Renderer((screen_width, screen_height), sprite_cache, use_shared_overlay, use_dirty_rects, full_update_fraction,
+                        use_ripple_renderer)
+    simulation = Simulation(center, circle_radius, boundary_thickness, gravity, air_resistance, ball_size,
+                            modifiers=modifiers, max_particles=max_particles, max_collision_lines=max_collision_lines)
+    simulation.selected_modifiers = selected_modifiers
+    simulation.isolate_modifiers = True  # A broken modifier is turned off and reported instead of crashing
+    notification_manager = NotificationManager()
+    governor = QualityGovernor(framerate)
+
+    audio = AudioScheduler(MidiIndex.empty(), NoteCache(note_cache_budget), max_voices, open_mixer=True,
+                           use_voice_mixer=use_voice_mixer)
+    audio.start()
+
+    startup_results = queue.SimpleQueue()
+    threading.Thread(target=load_in_background, args=(startup_results,), name="startup", daemon=True).start()
+    modifier_watcher = ModifierWatcher()
+    modifier_watcher.start()
+
+    dragging = False
+    drag_offset = pygame.Vector2(0, 0)
+    item_rects = []
+    triangle_rects = []
+    recorder = None  # Set while the session is being recorded (key 8)
+    first_frame = True
+    running = True
+
+    while running:
+        dt = clock.tick(framerate) / 1000.0
+        click_processed = False  # Reset click_processed at the start of each frame
+
+        if use_quality_governor:
+            change = governor.update(clock.get_rawtime())  # Last frame's work, without the wait in tick
+            if change:
+                governor.apply(simulation, renderer)
+                notification_manager.add_notification(f"Quality {'lowered' if change > 0 else 'raised'} to {governor.settings['name']}")
+
+        if change_hue:
+            if not governor.settings["hold_hue"]:
+                hue = (hue + dt * 10) % 360
+            color = pygame.Color(0)
+            color.hsva = (hue, 100, 100, 100)
+        else:
+            color = pygame.Color(255, 255, 255)
+
+        with profiler.span("input"):
+            while not startup_results.empty():
+                result = startup_results.get()
+                if result[0] == "modifiers":
+                    modifiers = {**result[1], **modifiers}  # Anything the watcher reloaded meanwhile is newer
+                    simulation.set_modifiers(modifiers)
+                    notification_manager.add_notification(f"Loaded {len(result[1])} modifiers")
+                elif result[0] == "midi":
+                    _, midi_file, midi_index = result
+                    audio.set_midi_index(midi_index, warm_up_note_cache)
+                    notification_manager.add_notification(f"MIDI file found: {midi_file}" if midi_file else "No MIDI file found")
+                elif result[0] == "error":
+                    notification_manager.add_notification(result[1])
+                elif result[0] == "done":
+                    print(f"Startup loading finished after {(time.perf_counter() - launch_time) * 1000:.0f} ms")
+
+            # Modifiers are only swapped here, between frames; a new dict each time keeps the swap atomic
+            for result in modifier_watcher.poll():
+                kind, name = result[:2]
+                if kind == "error":
+                    notification_manager.add_notification(f"Modifier {name} failed to load: {result[2]}")
+                    continue
+                if (kind == "removed" or result[2] is None) and name not in modifiers:
+                    continue  # Not a modifier (no modify function) and never was
+                updated = dict(modifiers)
+                if kind == "removed" or result[2] is None:
+                    updated.pop(name, None)
+                    notification_manager.add_notification(f"Removed modifier {name}")
+                else:
+                    notification_manager.add_notification(f"{'Reloaded' if name in modifiers else 'Added'} modifier {name}")
+                    updated[name] = result[2]
+                    if result[3] > slow_modifier_load:
+                        notification_manager.add_notification(f"Modifier {name} took {result[3]:.1f} s to load")
+                modifiers = updated
+                simulation.set_modifiers(modifiers)
+
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
+                elif event.type in (pygame.WINDOWEXPOSED, pygame.WINDOWRESTORED):
+                    renderer.invalidate()
+                elif event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_SPACE:
+                        (recorder or simulation).spawn_ball()
+                    elif event.key == pygame.K_m:
+                        menu_open = not menu_open
+                        menu_minimized = False
+                    elif event.key == pygame.K_1:
+                        simulation.show_lines = not simulation.show_lines
+                        notification_manager.add_notification(f"Show lines turned {'on' if simulation.show_lines else 'off'}")
+                    elif event.key == pygame.K_2:
+                        simulation.show_trail = not simulation.show_trail
+                        notification_manager.add_notification(f"Show trail turned {'on' if simulation.show_trail else 'off'}")
+                    elif event.key == pygame.K_3:
+                        change_hue = not change_hue
+                        notification_manager.add_notification(f"Change hue turned {'on' if change_hue else 'off'}")
+                    elif event.key == pygame.K_4:
+                        simulation.show_background_growing_circle = not simulation.show_background_growing_circle
+                        notification_manager.add_notification(f"Show background reactive circle turned {'on' if simulation.show_background_growing_circle else 'off'}")
+                    elif event.key == pygame.K_5:
+                        simulation.show_collision_growing_circle = not simulation.show_collision_growing_circle
+                        notification_manager.add_notification(f"Show collision circle turned {'on' if simulation.show_collision_growing_circle else 'off'}")
+                    elif event.key == pygame.K_6:
+                        profiler.toggle_overlay()
+                        notification_manager.add_notification(f"Profiler turned {'on' if profiler.show_overlay else 'off'}")
+                    elif event.key == pygame.K_7:
+                        if profiler.tracing:
+                            trace_path = time.strftime("trace-%Y%m%d-%H%M%S.json")
+                            event_count = profiler.stop_trace(trace_path)
+                            notification_manager.add_notification(f"Saved {event_count} spans to {trace_path}")
+                        else:
+                            profiler.start_trace()
+                            notification_manager.add_notification("Recording Chrome trace, press 7 to save")
+                    elif event.key == pygame.K_8:
+                        if recorder is not None:
+                            recorder.close()
+                            notification_manager.add_notification(f"Saved {recorder.steps} steps to {recorder.path}")
+                            recorder = None
+                        else:
+                            recorder = Recorder(time.strftime("recording-%Y%m%d-%H%M%S.bbr"), simulation)
+                            notification_manager.add_notification("Recording session, press 8 to save")
+                elif event.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP, pygame.MOUSEMOTION) and menu_open:
+                    if event.type == pygame.MOUSEMOTION and not dragging:
+                        continue  # Hovering changes nothing in the menu
+                    menu_rect, header_rect, close_button, minimize_button, item_rects, triangle_rects = draw_modifier_menu(screen, get_font(), modifiers, selected_modifiers, expanded_modifier, dragging, drag_offset, menu_minimized, draw=False)
+                    dragging, drag_offset, click_processed = handle_mouse_events(event, menu_rect, header_rect, close_button, minimize_button, dragging, drag_offset, click_processed)
+                    if event.type == pygame.MOUSEBUTTONDOWN:
+                        for item_rect, modifier_name in item_rects:
+                            if item_rect.collidepoint(event.pos):
+                                toggle_modifier(modifier_name, selected_modifiers)
+                                click_processed = True
+                        expanded_modifier, click_processed = handle_triangle_click(event, triangle_rects, expanded_modifier, click_processed)
+
+        bounced = (recorder or simulation).step(dt)
+        while simulation.modifier_problems:
+            notification_manager.add_notification(simulation.modifier_problems.pop(0))
+        while audio.problems:
+            notification_manager.add_notification(audio.problems.popleft())
+        audio.advance(len(bounced))
+
+        with profiler.span("draw"):
+            renderer.draw(screen, simulation, color)
+
+        ui_rects = []  # Drawn over the world this frame, so restored from it next frame
+        with profiler.span("menu"):
+            if menu_open:
+                menu_rect, header_rect, close_button, minimize_button, item_rects, triangle_rects = draw_modifier_menu(screen, get_font(), modifiers, selected_modifiers, expanded_modifier, dragging, drag_offset, menu_minimized)
+                ui_rects.append(pygame.Rect(menu_rect.topleft, menu_cache.surface.get_size()))
+
+        with profiler.span("notifications"):
+            notification_manager.update()
+            ui_rects += notification_manager.draw(screen)
+
+        if profiler.show_overlay:
+            ui_rects.append(profiler.draw(screen, {
+                "balls": simulation.world.count,
+                "circles": simulation.particles.count,
+                "lines": int(simulation.world.line_count[:simulation.world.count].sum()),
+                "sounds": audio.active_voices,
+                "quality": governor.settings["name"],
+            }, profiler_phases))
+
+        with profiler.span("flip"):
+            renderer.present(ui_rects)
+        profiler.end_frame()
+
+        if first_frame:
+            first_frame = False
+            print(f"First frame after {(time.perf_counter() - launch_time) * 1000:.0f} ms")
+
+    if recorder is not None:
+        recorder.close()
+    modifier_watcher.stop()
+    audio.stop()
+    pygame.quit()
+    sys.exit()
+
+
+if __name__ == "__main__":
+    main()
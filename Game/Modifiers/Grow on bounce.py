@@ -1,6 +1,9 @@
 """Ball grows larger on each bounce.
 """
 
+EVENTS = ("ball_bounce",)
+
+
 def modify(event_name, ball, additional_params):
     if event_name == "ball_bounce":
         ball.size += 10
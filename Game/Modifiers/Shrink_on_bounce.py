@@ -1,3 +1,8 @@
+import numpy as np
+
+EVENTS = ("ball_bounce",)
+
+
 def modify(event, ball, game):
     if event == "ball_bounce":
         previous_size = ball.size
@@ -5,4 +10,13 @@ def modify(event, ball, game):
         ball.radius = ball.size // 2
         size_ratio = ball.size / previous_size
         velocity_multiplier = 1 / size_ratio
-        ball.velocity *= velocity_multiplier
\ No newline at end of file
+        ball.velocity *= velocity_multiplier
+
+
+def modify_batch(event, world, indices, game):
+    previous_size = world.size[indices]
+    size = previous_size * 0.95
+    world.size[indices] = size
+    world.radius[indices] = np.floor_divide(size, 2)
+    size_ratio = size / previous_size
+    world.velocity[indices] *= (1 / size_ratio)[:, None]
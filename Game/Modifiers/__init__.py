@@ -0,0 +1,164 @@
+"""Modifier discovery and per-event dispatch.
+
+A modifier is a module in this folder. It can define either or both of:
+
+    EVENTS = ("ball_bounce",)                      # events it handles; every event if left out
+    def modify(event, ball, game): ...             # one ball at a time
+    def modify_batch(event, world, indices, game): # every ball the event fired for, as row indices
+
+modify_batch is preferred when present; a plain modify is wrapped so it is
+called once per ball.
+
+Modules are loaded straight from their files, so names that are not valid
+Python identifiers (like "Grow on bounce.py") work, and ModifierWatcher
+reloads them in the background whenever a file is added, changed or
+removed.
+"""
+import importlib.util
+import os
+import queue
+import sys
+import threading
+import time
+
+ALL_EVENTS = "*"
+MODIFIERS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+
+def single_ball_adapter(modify):
+    """Turn a one-ball modify(event, ball, game) into a modify_batch."""
+    def modify_batch(event, world, indices, game):
+        balls = world.balls
+        for index in indices.tolist():
+            modify(event, balls[index], game)
+    return modify_batch
+
+
+def modifier_files(folder=MODIFIERS_FOLDER):
+    """Map each modifier name to its file."""
+    return {filename[:-3]: os.path.join(folder, filename) for filename in sorted(os.listdir(folder))
+            if filename.endswith('.py') and filename != '__init__.py'}
+
+
+def load_modifier(name, path):
+    """Import (or re-import) one modifier file and return its entry, or None if it defines no modify."""
+    spec = importlib.util.spec_from_file_location(f'Modifiers.{name}', path)
+    module = importlib.util.module_from_spec(spec)
+    with open(path, 'rb') as f:
+        source = f.read()
+    # Compiled from the source every time: a cached .pyc is keyed on whole-second mtimes and can miss a quick re-save
+    exec(compile(source, path, 'exec'), module.__dict__)
+    sys.modules[spec.name] = module
+    if not (hasattr(module, 'modify') or hasattr(module, 'modify_batch')):
+        return None
+    return {
+        "function": getattr(module, 'modify', None),
+        "batch": getattr(module, 'modify_batch', None) or single_ball_adapter(module.modify),
+        "events": tuple(getattr(module, 'EVENTS', (ALL_EVENTS,))),
+        "description": module.__doc__ or "No description available"
+    }
+
+
+def load_modifiers(errors=None):
+    """Load every modifier in the folder.
+
+    A file that fails to import raises, unless an errors list is given; then
+    (name, message) is appended to it and the other modifiers still load.
+    """
+    modifiers = {}
+    for name, path in modifier_files().items():
+        try:
+            modifier = load_modifier(name, path)
+        except Exception as error:
+            if errors is None:
+                raise
+            errors.append((name, f"{type(error).__name__}: {error}"))
+            continue
+        if modifier is not None:
+            modifiers[name] = modifier
+    return modifiers
+
+
+class ModifierWatcher:
+    """Polls the Modifiers folder on a thread and loads whatever changed.
+
+    Results wait in a queue until the game collects them with poll(), so
+    the modifiers in use only ever change between frames:
+
+        ("loaded", name, modifier, seconds)   added or changed; modifier is None if it defines no modify
+        ("removed", name)
+        ("error", name, message)              the file failed to import; the old version stays in use
+    """
+
+    def __init__(self, folder=MODIFIERS_FOLDER, interval=0.5):
+        self.folder = folder
+        self.interval = interval
+        self.results = queue.SimpleQueue()
+        self._stamps = self._scan()  # What is loaded; whatever is here now was loaded at startup
+        self._last_scan = self._stamps
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="modifier-watcher", daemon=True)
+
+    def _scan(self):
+        stamps = {}
+        for name, path in modifier_files(self.folder).items():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue  # Removed between listing and stat
+            stamps[name] = (stat.st_mtime_ns, stat.st_size)
+        return stamps
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def poll(self):
+        """Every result finished since the last call, oldest first."""
+        results = []
+        while not self.results.empty():
+            results.append(self.results.get())
+        return results
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                stamps = self._scan()
+            except OSError:
+                continue
+            # Only act on files that looked the same on the previous scan too, so a save
+            # caught half-written (or a delete-and-rename save) is not loaded or dropped
+            previous, self._last_scan = self._last_scan, stamps
+            for name in self._stamps.keys() - stamps.keys() - previous.keys():
+                self.results.put(("removed", name))
+                del self._stamps[name]
+            for name, stamp in stamps.items():
+                if self._stamps.get(name) == stamp or previous.get(name) != stamp:
+                    continue
+                self._stamps[name] = stamp
+                start = time.perf_counter()
+                try:
+                    modifier = load_modifier(name, os.path.join(self.folder, name + '.py'))
+                except Exception as error:
+                    self.results.put(("error", name, f"{type(error).__name__}: {error}"))
+                else:
+                    self.results.put(("loaded", name, modifier, time.perf_counter() - start))
+
+
+def build_dispatch(modifiers, selected):
+    """Map each event name to (name, batch handler) for the selected modifiers, in selection order.
+
+    Modifiers that did not declare EVENTS are listed under every event, in
+    their place in the selection; ALL_EVENTS holds just those, for events
+    no selected modifier declared.
+    """
+    chosen = [(name, modifiers[name]) for name in selected if name in modifiers]
+    dispatch = {event: [] for _, modifier in chosen for event in modifier["events"]}
+    dispatch[ALL_EVENTS] = []
+    for name, modifier in chosen:
+        for event, handlers in dispatch.items():
+            if event in modifier["events"] or ALL_EVENTS in modifier["events"]:
+                handlers.append((name, modifier["batch"]))
+    return dispatch
@@ -0,0 +1,116 @@
+"""Fixed-capacity pool for growing circles (trails, collision rings and background ripples).
+
+Particles are rows in preallocated NumPy arrays instead of one object each,
+so spawning and fading hundreds of them a second does not churn the
+allocator. Dead rows are filled by swapping in live rows from the end, and
+when the pool is full the oldest particles are evicted first.
+"""
+import numpy as np
+
+
+class ParticlePool:
+    _fields = ("pos", "radius", "growth_rate", "alpha", "fade_rate", "color", "layer", "serial")
+
+    def __init__(self, capacity=8192):
+        self.capacity = capacity
+        self.limit = capacity  # Live particles allowed, lowered by the quality governor
+        self.count = 0
+        self.pos = np.zeros((capacity, 2), dtype='float64')
+        self.radius = np.zeros(capacity, dtype='float64')
+        self.growth_rate = np.zeros(capacity, dtype='float64')
+        self.alpha = np.zeros(capacity, dtype='float64')
+        self.fade_rate = np.zeros(capacity, dtype='float64')
+        self.color = np.zeros((capacity, 3), dtype='uint8')
+        self.layer = np.zeros(capacity, dtype='int8')
+        self.serial = np.zeros(capacity, dtype='int64')  # Spawn order, used for oldest-first eviction
+        self._next_serial = 0
+
+    def emit(self, x, y, radius, growth_rate, color, alpha=255, fade_rate=255, layer=1):
+        self.emit_many(((x, y),), radius, growth_rate, (tuple(color)[:3],), alpha, fade_rate, layer)
+
+    def emit_many(self, pos, radius, growth_rate, color, alpha=255, fade_rate=255, layer=1):
+        """Spawn len(pos) particles; every other argument is a scalar or a per-particle array."""
+        pos = np.asarray(pos, dtype='float64').reshape(-1, 2)
+        k = len(pos)
+        if k == 0:
+            return
+        if k > self.limit:
+            # Only the newest particles of an oversized batch could survive anyway
+            skip = k - self.limit
+            pos = pos[skip:]
+            radius, growth_rate, color, alpha, fade_rate, layer = (
+                value[skip:] if np.ndim(value) and len(value) == k else value
+                for value in (radius, growth_rate, color, alpha, fade_rate, layer)
+            )
+            k = self.limit
+        self._make_room(k)
+
+        rows = slice(self.count, self.count + k)
+        self.pos[rows] = pos
+        self.radius[rows] = radius
+        self.growth_rate[rows] = growth_rate
+        self.color[rows] = np.asarray(color, dtype='uint8').reshape(-1, 3)
+        self.alpha[rows] = alpha
+        self.fade_rate[rows] = fade_rate
+        self.layer[rows] = layer
+        self.serial[rows] = np.arange(self._next_serial, self._next_serial + k)
+        self._next_serial += k
+        self.count += k
+
+    def _make_room(self, k):
+        overflow = self.count + k - self.limit
+        if overflow <= 0:
+            return
+        alive = np.ones(self.count, dtype=bool)
+        oldest = np.argpartition(self.serial[:self.count], overflow - 1)[:overflow]
+        alive[oldest] = False
+        self._compact(alive)
+
+    def _compact(self, alive):
+        """Swap-remove every dead row by moving live rows from the tail into the holes."""
+        live_count = int(alive.sum())
+        holes = np.flatnonzero(~alive[:live_count])
+        movers = np.flatnonzero(alive[live_count:]) + live_count
+        if holes.size:
+            for name in self._fields:
+                array = getattr(self, name)
+                array[holes] = array[movers]
+        self.count = live_count
+
+    def update(self, dt):
+        n = self.count
+        if n == 0:
+            return
+        radius = self.radius[:n]
+        alpha = self.alpha[:n]
+        radius += self.growth_rate[:n] * dt
+        alpha -= self.fade_rate[:n] * dt
+        np.maximum(radius, 0, out=radius)
+        np.maximum(alpha, 0, out=alpha)
+        alive = (alpha > 0) & (radius > 0)
+        if not alive.all():
+            self._compact(alive)
+
+    def indices(self, layer):
+        """Rows currently in the given draw layer."""
+        return np.flatnonzero(self.layer[:self.count] == layer)
+
+    def snapshot(self):
+        """Copy of every live particle, enough to rebuild the pool with from_snapshot."""
+        state = {name: getattr(self, name)[:self.count].copy() for name in self._fields}
+        state.update(capacity=self.capacity, limit=self.limit, next_serial=self._next_serial)
+        return state
+
+    @classmethod
+    def from_snapshot(cls, state):
+        pool = cls(state["capacity"])
+        count = len(state["pos"])
+        for name in cls._fields:
+            getattr(pool, name)[:count] = state[name]
+        pool.count = count
+        pool.limit = state["limit"]
+        pool._next_serial = state["next_serial"]
+        return pool
+
+    def clear(self):
+        self.count = 0
@@ -0,0 +1,168 @@
+"""Lightweight frame profiler.
+
+Wrap a piece of work in a span to have it timed:
+
+    from Profiler import profiler
+
+    with profiler.span("my_modifier"):
+        ...
+
+While the profiler is off, span() hands back one shared do-nothing context
+manager, so leaving spans in hot code costs about one method call. When on,
+it keeps a rolling window of frame times and per-span totals for the
+on-screen overlay, and can record every span to a Chrome trace file
+(open it in chrome://tracing or https://ui.perfetto.dev).
+"""
+import json
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler._record(self.name, self.start, time.perf_counter())
+        return False
+
+
+class Profiler:
+    def __init__(self, history=240, max_trace_events=500000):
+        self.show_overlay = False
+        self.tracing = False
+        self.active = False  # Overlay shown or trace recording; spans are free otherwise
+        self.history = history
+        self.max_trace_events = max_trace_events
+        self.frame_times = deque(maxlen=history)  # Milliseconds between frame ends
+        self.phase_times = defaultdict(lambda: deque(maxlen=self.history))  # Milliseconds per frame, per span name
+        self._current = defaultdict(float)
+        self._last_frame_end = None
+        self._trace = []
+        self._trace_origin = time.perf_counter()
+        self._font = None
+
+    def _update_active(self):
+        self.active = self.show_overlay or self.tracing
+        if not self.active:
+            self._last_frame_end = None
+
+    def toggle_overlay(self):
+        self.show_overlay = not self.show_overlay
+        self._update_active()
+        return self.show_overlay
+
+    def start_trace(self):
+        self._trace = []
+        self._trace_origin = time.perf_counter()
+        self.tracing = True
+        self._update_active()
+
+    def stop_trace(self, path):
+        """Stop recording and write the recorded spans as a Chrome trace. Returns the event count."""
+        self.tracing = False
+        self._update_active()
+        events = self._trace
+        self._trace = []
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return len(events)
+
+    def span(self, name):
+        if not self.active:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def _record(self, name, start, end):
+        self._current[name] += (end - start) * 1000
+        if self.tracing and len(self._trace) < self.max_trace_events:
+            start = max(start, self._trace_origin)  # Spans already open when tracing started, like the input span of the key press
+            self._trace.append({
+                "name": name,
+                "ph": "X",
+                "ts": (start - self._trace_origin) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": 0,
+                "tid": 0,
+            })
+
+    def end_frame(self):
+        if not self.active:
+            return
+        now = time.perf_counter()
+        if self._last_frame_end is not None:
+            self.frame_times.append((now - self._last_frame_end) * 1000)
+        self._last_frame_end = now
+        for name in set(self.phase_times) | set(self._current):
+            self.phase_times[name].append(self._current.get(name, 0.0))
+        self._current.clear()
+
+    def frame_percentiles(self, percentiles=(50, 95, 99)):
+        if not self.frame_times:
+            return {p: 0.0 for p in percentiles}
+        values = np.percentile(np.fromiter(self.frame_times, dtype=float), percentiles)
+        return dict(zip(percentiles, values.tolist()))
+
+    def phase_means(self):
+        return {name: sum(values) / len(values) for name, values in self.phase_times.items() if values}
+
+    def draw(self, screen, counters, phase_order=()):
+        """Draw the overlay in the top-right corner and return its rect; counters maps a label to a live count."""
+        import pygame
+
+        if self._font is None:
+            pygame.font.init()
+            self._font = pygame.font.Font(None, 22)
+        font = self._font
+
+        frame = self.frame_percentiles()
+        title = font.render(f"frame p50 {frame[50]:.1f}  p95 {frame[95]:.1f}  p99 {frame[99]:.1f} ms", True, (255, 255, 255))
+        rows = []
+        means = self.phase_means()
+        for name in list(phase_order) + sorted(set(means) - set(phase_order)):
+            if name in means:
+                rows.append((name, f"{means[name]:.2f} ms"))
+        rows.extend((label, str(value)) for label, value in counters.items())
+        if self.tracing:
+            rows.append(("trace", f"{len(self._trace)} spans"))
+
+        rows = [(font.render(label, True, (200, 200, 200)), font.render(value, True, (255, 255, 255))) for label, value in rows]
+        line_height = font.get_linesize()
+        label_width = max((label.get_width() for label, _ in rows), default=0)
+        value_width = max((value.get_width() for _, value in rows), default=0)
+        width = max(title.get_width(), label_width + 20 + value_width) + 20
+        height = line_height * (len(rows) + 1) + 20
+        x = screen.get_width() - width - 10
+        panel = pygame.Surface((width, height), pygame.SRCALPHA)
+        panel.fill((0, 0, 0, 180))
+        panel_rect = screen.blit(panel, (x, 10))
+        screen.blit(title, (x + 10, 20))
+        y = 20 + line_height
+        for label, value in rows:
+            screen.blit(label, (x + 10, y))
+            screen.blit(value, (x + width - 10 - value.get_width(), y))
+            y += line_height
+        return panel_rect
+
+
+profiler = Profiler()
@@ -0,0 +1,78 @@
+"""Automatic quality levels that keep the frame time within budget.
+
+The governor watches how long each frame actually took to build (without
+the time Clock.tick spends waiting) over a rolling window. When the median
+goes over the budget set by the frame rate it drops one level, shedding
+effects in this order: thinner trails, fewer growing circles, fewer
+collision lines drawn, no anti-aliasing and a fixed boundary hue. Once
+frames have had plenty of headroom for a while it climbs back up a level.
+"""
+import statistics
+import time
+from collections import deque
+
+QUALITY_LEVELS = (
+    {"name": "full", "trail_every": 1, "max_growing_circles": None, "max_lines_drawn": None,
+     "antialias": True, "hold_hue": False},
+    {"name": "thinner trails", "trail_every": 2, "max_growing_circles": None, "max_lines_drawn": None,
+     "antialias": True, "hold_hue": False},
+    {"name": "fewer growing circles", "trail_every": 3, "max_growing_circles": 1024, "max_lines_drawn": None,
+     "antialias": True, "hold_hue": False},
+    {"name": "fewer collision lines", "trail_every": 3, "max_growing_circles": 512, "max_lines_drawn": 16,
+     "antialias": True, "hold_hue": False},
+    {"name": "no anti-aliasing", "trail_every": 4, "max_growing_circles": 256, "max_lines_drawn": 4,
+     "antialias": False, "hold_hue": True},
+)
+
+
+class QualityGovernor:
+    def __init__(self, framerate, levels=QUALITY_LEVELS, window=30, min_frames=5, headroom=0.6, raise_after=3.0):
+        self.levels = levels
+        self.budget = 1000.0 / framerate  # Milliseconds per frame
+        self.frame_times = deque(maxlen=window)
+        self.min_frames = min_frames  # So a single hitch cannot change the level on its own
+        self.headroom = headroom  # Share of the budget frames must stay under before quality goes back up
+        self.raise_after = raise_after  # Seconds of headroom needed before raising quality
+        self.level = 0
+        self._headroom_since = None
+
+    @property
+    def settings(self):
+        return self.levels[self.level]
+
+    def update(self, frame_ms, now=None):
+        """Add one frame's work time; return +1 or -1 if the level should go down or up, else 0."""
+        now = time.perf_counter() if now is None else now
+        self.frame_times.append(frame_ms)
+        total = sum(self.frame_times)
+        # Judge a full window, or fewer frames once they add up to as long as a full window should take
+        if len(self.frame_times) < self.min_frames or (len(self.frame_times) < self.frame_times.maxlen
+                                                       and total < self.frame_times.maxlen * self.budget):
+            return 0
+        typical = statistics.median(self.frame_times)  # One hitch (loading, a GC pause) is not load
+
+        if typical > self.budget and self.level < len(self.levels) - 1:
+            self.level += 1
+            self.frame_times.clear()  # Judge the new level on its own frames
+            self._headroom_since = None
+            return 1
+        if typical < self.budget * self.headroom and self.level > 0:
+            if self._headroom_since is None:
+                self._headroom_since = now
+            elif now - self._headroom_since >= self.raise_after:
+                self.level -= 1
+                self.frame_times.clear()
+                self._headroom_since = None
+                return -1
+        else:
+            self._headroom_since = None
+        return 0
+
+    def apply(self, simulation, renderer):
+        """Push the current level's settings into the simulation and renderer."""
+        settings = self.settings
+        simulation.trail_every = settings["trail_every"]
+        particles = simulation.particles
+        particles.limit = min(settings["max_growing_circles"] or particles.capacity, particles.capacity)
+        renderer.max_lines_drawn = settings["max_lines_drawn"]
+        renderer.sprite_cache.antialias = settings["antialias"]
@@ -0,0 +1,466 @@
+"""Drawing helpers shared by the game loop."""
+from collections import OrderedDict
+
+import numpy as np
+import pygame
+import pygame.gfxdraw
+
+
+class SpriteCache:
+    """Bounded LRU cache of pre-rasterized anti-aliased circles.
+
+    Sprites are keyed by quantized radius and colour and rasterized fully
+    opaque; transparency is applied per blit with set_alpha, so a circle
+    that fades out reuses one sprite for its whole life.
+    """
+
+    def __init__(self, memory_budget=32 * 1024 * 1024, color_step=4, large_sprite_fraction=1 / 64, large_sprite_admit_after=4):
+        self.memory_budget = memory_budget  # Bytes of pixel data kept alive
+        # Sprites bigger than this share of the budget (background ripples, the boundary ring) are only
+        # cached once they have been asked for a few times, so one-off giants cannot flush everything else
+        self.large_sprite_bytes = int(memory_budget * large_sprite_fraction)
+        self.large_sprite_admit_after = large_sprite_admit_after
+        self._large_requests = OrderedDict()
+        self.color_step = color_step  # Colours are snapped to this grid so slow hue drift still hits
+        self.antialias = True  # Turned off by the quality governor to make new sprites cheaper
+        self.memory_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._sprites = OrderedDict()
+
+    def _quantize_color(self, color):
+        step = self.color_step
+        return tuple(min(255, int(c) // step * step) for c in tuple(color)[:3])
+
+    def _get(self, key, render):
+        sprite = self._sprites.get(key)
+        if sprite is not None:
+            self._sprites.move_to_end(key)
+            self.hits += 1
+            return sprite
+
+        self.misses += 1
+        sprite = render()
+        size = sprite.get_width() * sprite.get_height() * 4
+        if size > self.large_sprite_bytes:
+            requests = self._large_requests.pop(key, 0) + 1
+            if requests < self.large_sprite_admit_after:
+                self._large_requests[key] = requests
+                if len(self._large_requests) > 256:
+                    self._large_requests.popitem(last=False)
+                return sprite
+        self._sprites[key] = sprite
+        self.memory_used += size
+        while self.memory_used > self.memory_budget:
+            _, evicted = self._sprites.popitem(last=False)
+            self.memory_used -= evicted.get_width() * evicted.get_height() * 4
+            self.evictions += 1
+        return sprite
+
+    def circle(self, radius, color):
+        """Filled anti-aliased circle of the given radius, centred in a (2r+1)-square sprite."""
+        radius = max(int(radius), 0)
+        color = self._quantize_color(color)
+
+        def render():
+            surface = pygame.Surface((radius * 2 + 1, radius * 2 + 1), pygame.SRCALPHA).convert_alpha()
+            pygame.gfxdraw.filled_circle(surface, radius, radius, radius, color)
+            if antialias:
+                pygame.gfxdraw.aacircle(surface, radius, radius, radius, color)
+            return surface
+
+        antialias = self.antialias
+        return self._get(("circle", radius, color, antialias), render)
+
+    def ring(self, outer_radius, inner_radius, color, inner_color=(0, 0, 0)):
+        """Filled circle with an opaque inner disc, like the arena boundary and the ball bodies."""
+        outer_radius = max(int(outer_radius), 0)
+        inner_radius = max(int(inner_radius), 0)
+        color = self._quantize_color(color)
+        inner_color = tuple(inner_color)[:3]
+
+        def render():
+            surface = pygame.Surface((outer_radius * 2 + 1, outer_radius * 2 + 1), pygame.SRCALPHA).convert_alpha()
+            pygame.gfxdraw.filled_circle(surface, outer_radius, outer_radius, outer_radius, color)
+            if antialias:
+                pygame.gfxdraw.aacircle(surface, outer_radius, outer_radius, outer_radius, color)
+            pygame.gfxdraw.filled_circle(surface, outer_radius, outer_radius, inner_radius, inner_color)
+            if antialias:
+                pygame.gfxdraw.aacircle(surface, outer_radius, outer_radius, inner_radius, inner_color)
+            return surface
+
+        antialias = self.antialias
+        return self._get(("ring", outer_radius, inner_radius, color, inner_color, antialias), render)
+
+    def blit_circle(self, target, x, y, radius, color, alpha=255):
+        sprite = self.circle(radius, color)
+        sprite.set_alpha(int(alpha))
+        return target.blit(sprite, (int(x) - int(radius), int(y) - int(radius)))
+
+    def blit_ring(self, target, x, y, outer_radius, inner_radius, color, alpha=255):
+        sprite = self.ring(outer_radius, inner_radius, color)
+        sprite.set_alpha(int(alpha))
+        return target.blit(sprite, (int(x) - int(outer_radius), int(y) - int(outer_radius)))
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "sprites": len(self._sprites),
+            "memory_used": self.memory_used,
+        }
+
+    def clear(self):
+        self._sprites.clear()
+        self._large_requests.clear()
+        self.memory_used = 0
+
+
+def collision_line_starts(world, max_lines=None):
+    """Start points of every ball's collision lines, computed for all balls at once.
+
+    Each line runs from just inside its collision point to the ball. The
+    start is pulled in further the more the line leans away from the
+    boundary normal. Returns an (n, max_collision_lines, 2) array of starts
+    and a matching mask of the lines worth drawing, limited to each ball's
+    newest max_lines if given.
+    """
+    n = world.count
+    points = world.line_points[:n]
+    slots = np.arange(world.max_collision_lines)
+    valid = slots < world.line_count[:n, None]
+    if max_lines is not None:
+        age = (world.line_head[:n, None] - 1 - slots) % world.max_collision_lines  # 0 is the newest line
+        valid &= age < max_lines
+
+    direction = world.pos[:n, None, :] - points
+    direction_length = np.hypot(direction[..., 0], direction[..., 1])
+    normal = points - world.center
+    normal_length = np.hypot(normal[..., 0], normal[..., 1])
+    valid &= (direction_length > 5) & (normal_length > 0)  # Skip lines too short to draw
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        direction /= direction_length[..., None]
+        normal /= normal_length[..., None]
+        angle = np.arccos(np.clip(np.einsum('...i,...i->...', direction, normal), -1.0, 1.0))
+    shorten_factor = 5 + 2 * (angle / np.pi)
+    return points + direction * shorten_factor[..., None], valid
+
+
+def rects_area(rects):
+    """Total area of the rects, counting overlaps more than once."""
+    return sum(rect.width * rect.height for rect in rects)
+
+
+def coalesce_rects(rects, size, tile=32):
+    """Cover the rects with tile-aligned strips, one per run of touched tiles in a row of tiles.
+
+    Hundreds of overlapping trail circles collapse into a few strips that
+    are each restored and pushed to the display once.
+    """
+    columns, rows = -(-size[0] // tile), -(-size[1] // tile)
+    touched = np.zeros((rows, columns + 1), dtype=bool)  # Spare column ends every run
+    for rect in rects:
+        if rect.width > 0 and rect.height > 0:
+            touched[max(rect.top, 0) // tile:(rect.bottom - 1) // tile + 1,
+                    max(rect.left, 0) // tile:(rect.right - 1) // tile + 1] = True
+    edges = np.diff(touched.astype('int8'), axis=1, prepend=0)
+    starts = np.argwhere(edges == 1)
+    ends = np.argwhere(edges == -1)[:, 1]
+    bounds = pygame.Rect((0, 0), size)
+    return [pygame.Rect(start * tile, row * tile, (end - start) * tile, tile).clip(bounds)
+            for (row, start), end in zip(starts.tolist(), ends.tolist())]
+
+
+def merge_rects(rects):
+    """Union overlapping rects so no pixel is covered twice."""
+    merged = []
+    for rect in rects:
+        rect = pygame.Rect(rect)
+        i = rect.collidelist(merged)
+        while i != -1:
+            rect.union_ip(merged.pop(i))
+            i = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
+
+
+class BallOverlay:
+    """A single reusable transparent layer that every ball (or every ball's lines) draws into.
+
+    Only the areas drawn last frame are cleared, and only the areas drawn
+    this frame are composited onto the screen, so the cost follows the
+    drawn area rather than ball count times screen size.
+    """
+
+    def __init__(self, size):
+        self.surface = pygame.Surface(size, pygame.SRCALPHA)
+        self.bounds = self.surface.get_rect()
+        self._previous = []
+        self._current = []
+
+    def begin(self):
+        for rect in self._previous:
+            self.surface.fill((0, 0, 0, 0), rect)
+        self._current = []
+
+    def mark(self, rect):
+        rect = self.bounds.clip(rect)
+        if rect.width and rect.height:
+            self._current.append(rect)
+
+    def composite(self, screen):
+        """Blit this frame's drawn areas onto the screen and return them."""
+        self._previous = merge_rects(self._current)
+        for rect in self._previous:
+            screen.blit(self.surface, rect.topleft, rect)
+        return self._previous
+
+
+class RippleRenderer:
+    """Draws every background ripple (particle layer 0) in one pass.
+
+    The ripples all share the arena centre, so stacking them is a function
+    of the distance from it alone. Each frame the ripples are alpha-blended
+    in draw order into one radial colour profile (a few thousand sub-pixel
+    distance bins), and the profile is mapped onto the screen through a
+    distance map computed once. The cost is one gather per visible pixel
+    however many ripples there are. Pixels hidden under the opaque boundary
+    ring are never touched.
+    """
+
+    def __init__(self, size, oversample=4):
+        self.size = size
+        self.oversample = oversample  # Distance bins per pixel
+        self._edges = {}
+        self._key = None
+        self._buffer = bytearray(size[0] * size[1] * 4)
+        self._pixels = np.frombuffer(self._buffer, dtype=np.uint8).reshape(-1, 4)
+        self.surface = pygame.image.frombuffer(self._buffer, size, "RGBX")  # Shares memory with _pixels
+
+    def edge(self, antialias, reference_radius=64, width=3):
+        """Average coverage of a circle sprite's rim, sampled from gfxdraw itself.
+
+        Entry k covers distances (k / oversample - width) past the radius;
+        everything further in is fully covered, everything past the end not at all.
+        """
+        if antialias not in self._edges:
+            r = reference_radius
+            surface = pygame.Surface((r * 2 + 1, r * 2 + 1), pygame.SRCALPHA)
+            pygame.gfxdraw.filled_circle(surface, r, r, r, (255, 255, 255))
+            if antialias:
+                pygame.gfxdraw.aacircle(surface, r, r, r, (255, 255, 255))
+            xs, ys = np.mgrid[0:r * 2 + 1, 0:r * 2 + 1]
+            offset = np.round((np.hypot(xs - r, ys - r) - r + width) * self.oversample).astype(np.intp).ravel()
+            inside = (offset >= 0) & (offset < 2 * width * self.oversample)
+            alpha = pygame.surfarray.array_alpha(surface).ravel()[inside] / 255
+            counts = np.bincount(offset[inside], minlength=2 * width * self.oversample)
+            self._edges[antialias] = np.bincount(offset[inside], alpha, len(counts)) / np.maximum(counts, 1)
+        return self._edges[antialias]
+
+    def _prepare(self, center, hidden_radius):
+        key = (int(center[0]), int(center[1]), hidden_radius)
+        if key == self._key:
+            return
+        width, height = self.size
+        ys, xs = np.mgrid[0:height, 0:width]
+        distance = np.hypot(xs - key[0], ys - key[1]).ravel()
+        self._visible = np.flatnonzero(distance >= hidden_radius)
+        self._bins = np.round(distance[self._visible] * self.oversample).astype(np.intp)
+        self._bin_count = self._bins.max(initial=0) + 1
+        self._pixels[:] = 0
+        self._key = key
+
+    def profile(self, radius, colors, alphas, antialias=True, width=3):
+        """Colour at every distance bin after blending the ripples over black, in order."""
+        edge = np.concatenate(([1.0], self.edge(antialias, width=width), [0.0]))
+        # Sprites are drawn at whole-pixel radii; look each bin up on that ripple's rim
+        offset = np.arange(self._bin_count) - (np.floor(radius)[:, None] - width) * self.oversample + 1
+        cover = edge[np.clip(offset, 0, len(edge) - 1).astype(np.intp)]
+        cover *= (np.floor(alphas) / 255)[:, None]
+        # A ripple shows through every ripple drawn after it
+        after = np.ones_like(cover)
+        after[:-1] = np.cumprod(1 - cover[:0:-1], axis=0)[::-1]
+        return np.rint((cover * after).T @ colors).astype(np.uint8)
+
+    def draw(self, screen, particles, center, hidden_radius=0, antialias=True, color_step=1):
+        """Replace the screen with the ripples on black; False if there is nothing (or nothing this can) draw."""
+        rows = particles.indices(0)
+        if len(rows) == 0 or not (particles.pos[rows] == center).all():
+            return False
+        self._prepare(center, hidden_radius)
+        colors = np.minimum(particles.color[rows] // color_step * color_step, 255).astype(np.float64)  # As the sprites snap them
+        profile = self.profile(particles.radius[rows], colors, particles.alpha[rows], antialias)
+        self._pixels[self._visible, :3] = profile[self._bins]
+        screen.blit(self.surface, (0, 0))
+        return True
+
+
+class Renderer:
+    """Draws a Simulation: background ripples, the boundary ring, particles and balls.
+
+    With use_dirty_rects, the black background and boundary ring are kept
+    pre-rendered, only the areas drawn last frame are restored from them,
+    and present() pushes just the changed areas to the display. Frames
+    where background ripples are alive, the ring changes colour or the
+    changed area exceeds full_update_fraction of the screen are redrawn
+    and flipped in full.
+    """
+
+    def __init__(self, size, sprite_cache, use_shared_overlay=True, use_dirty_rects=False, full_update_fraction=0.5,
+                 use_ripple_renderer=True):
+        self.size = size
+        self.sprite_cache = sprite_cache
+        self.use_shared_overlay = use_shared_overlay  # One reusable ball layer instead of a full-screen surface per ball
+        self.ball_overlay = BallOverlay(size)
+        self.line_overlay = BallOverlay(size)  # Every ball's collision lines, blended onto the screen in one go
+        self.use_ripple_renderer = use_ripple_renderer  # All background ripples in one pass instead of a sprite each
+        self.ripple_renderer = RippleRenderer(size)
+        self.use_dirty_rects = use_dirty_rects
+        self.full_update_fraction = full_update_fraction
+        self.screen_rect = pygame.Rect((0, 0), size)
+        self.background = None  # Black screen with the boundary ring, for restoring damaged areas
+        self._background_color = None
+        self._previous_rects = []  # Everything drawn last frame, world and UI
+        self._world_rects = []
+        self._dirty = None  # Areas to push this frame, or None for a full flip
+        self.max_lines_drawn = None  # Newest collision lines drawn per ball; None draws them all
+        self.full_updates = 0
+        self.partial_updates = 0
+
+    def invalidate(self):
+        """Force the next frame to be redrawn in full, e.g. after the window was covered."""
+        self.background = None
+
+    def draw(self, screen, simulation, boundary_color):
+        if not self.use_dirty_rects:
+            self.draw_background(screen, simulation)
+            self.draw_boundary(screen, simulation, boundary_color)
+            self.draw_particle_layer(screen, simulation.particles, 1)
+            self.draw_balls(screen, simulation.world, simulation.show_lines)
+            return
+
+        ring_color = self.sprite_cache._quantize_color(boundary_color)
+        full = self.background is None or ring_color != self._background_color
+        if full:
+            self.background = pygame.Surface(self.size).convert()
+            self.background.fill((0, 0, 0))
+            self.draw_boundary(self.background, simulation, boundary_color)
+            self._background_color = ring_color
+
+        ripples = len(simulation.particles.indices(0)) > 0
+        full_limit = self.full_update_fraction * self.size[0] * self.size[1]
+        restore = coalesce_rects(self._previous_rects, self.size)
+        if full or ripples or rects_area(restore) > full_limit:
+            if ripples:
+                self.draw_background(screen, simulation)
+                self.draw_boundary(screen, simulation, boundary_color)
+            else:
+                screen.blit(self.background, (0, 0))
+            drawn = self.draw_particle_layer(screen, simulation.particles, 1)
+            drawn += self.draw_balls(screen, simulation.world, simulation.show_lines)
+            # Ripples live outside the ring, where none of the tracked rects reach
+            self._world_rects = [self.screen_rect] if ripples else drawn
+            self._dirty = None
+            return
+
+        for rect in restore:
+            screen.blit(self.background, rect, rect)
+        drawn = self.draw_particle_layer(screen, simulation.particles, 1)
+        drawn += self.draw_balls(screen, simulation.world, simulation.show_lines)
+        self._world_rects = drawn
+        self._dirty = restore + drawn
+
+    def present(self, ui_rects=()):
+        """Show the frame: the changed areas plus ui_rects (menus and text drawn after draw), or a full flip."""
+        ui_rects = [pygame.Rect(rect) for rect in ui_rects]
+        if not self.use_dirty_rects:
+            pygame.display.flip()
+            return
+        dirty = None if self._dirty is None else coalesce_rects(self._dirty + ui_rects, self.size)
+        if dirty is None or rects_area(dirty) > self.full_update_fraction * self.size[0] * self.size[1]:
+            pygame.display.flip()
+            self.full_updates += 1
+        else:
+            pygame.display.update(dirty)
+            self.partial_updates += 1
+        self._previous_rects = self._world_rects + ui_rects
+
+    def draw_background(self, screen, simulation):
+        """Black, with the background ripples on it."""
+        if self.use_ripple_renderer:
+            # The ring's opaque inner disc covers everything short of its anti-aliased inner edge
+            hidden_radius = simulation.circle_radius - simulation.boundary_thickness - 2
+            cache = self.sprite_cache
+            if self.ripple_renderer.draw(screen, simulation.particles, simulation.center, hidden_radius,
+                                         cache.antialias, cache.color_step):
+                return
+        screen.fill((0, 0, 0))
+        self.draw_particle_layer(screen, simulation.particles, 0)
+
+    def draw_boundary(self, screen, simulation, color):
+        center = simulation.center
+        self.sprite_cache.blit_ring(screen, center[0], center[1],
+                                    simulation.circle_radius + int(simulation.boundary_thickness / 2),
+                                    simulation.circle_radius - simulation.boundary_thickness, color)
+
+    def draw_particle_layer(self, screen, particles, layer):
+        """Draw one layer of growing circles and return the areas they cover."""
+        rows = particles.indices(layer)
+        positions = particles.pos[rows].tolist()
+        radii = particles.radius[rows].tolist()
+        colors = particles.color[rows].tolist()
+        alphas = particles.alpha[rows].tolist()
+        blit_circle = self.sprite_cache.blit_circle
+        return [blit_circle(screen, x, y, radius, circle_color, alpha)
+                for (x, y), radius, circle_color, alpha in zip(positions, radii, colors, alphas)]
+
+    def draw_lines(self, surface, world, i, line_starts, line_valid):
+        """Draw ball i's collision lines onto surface and return the area touched, or None if it has none."""
+        starts = line_starts[i][line_valid[i]]
+        if not len(starts):
+            return None
+        color_with_opacity = (*world.color[i].tolist(), int(world.line_opacity[i]))
+        end = world.pos[i].astype(int).tolist()
+        draw_line = pygame.draw.line
+        # One call per line: a single polyline would have to double back through the ball, drawing most lines twice
+        rects = [draw_line(surface, color_with_opacity, start, end, 1) for start in starts.astype(int).tolist()]
+        return rects[0].unionall(rects[1:])
+
+    def draw_ball(self, surface, world, i):
+        """Draw ball i onto surface and return the area touched."""
+        pos = world.pos[i]
+        radius = int(world.radius[i])
+        return self.sprite_cache.blit_ring(surface, pos[0], pos[1], radius, int((4 * radius) / 5),
+                                           tuple(world.color[i].tolist()))
+
+    def draw_balls(self, screen, world, show_lines):
+        """Draw every ball's collision lines, then every ball, and return the areas they cover.
+
+        draw.lines writes alpha instead of blending it, so lines drawn among
+        the balls would punch holes in them. Instead all the lines go into one
+        layer that is blended onto the screen once, beneath the balls.
+        """
+        drawn = []
+        if show_lines and world.count:
+            line_starts, line_valid = collision_line_starts(world, self.max_lines_drawn)
+            lines = self.line_overlay
+            lines.begin()
+            for i in range(world.count):
+                rect = self.draw_lines(lines.surface, world, i, line_starts, line_valid)
+                if rect is not None:
+                    lines.mark(rect)
+            drawn = lines.composite(screen)
+        if self.use_shared_overlay:
+            overlay = self.ball_overlay
+            overlay.begin()
+            for i in range(world.count):
+                overlay.mark(self.draw_ball(overlay.surface, world, i))
+            return drawn + overlay.composite(screen)
+        for i in range(world.count):
+            surface = pygame.Surface(self.size, pygame.SRCALPHA)
+            self.draw_ball(surface, world, i)
+            screen.blit(surface, (0, 0))
+        return drawn + ([self.screen_rect] if world.count else [])
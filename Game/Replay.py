@@ -0,0 +1,348 @@
+"""Record a session to a compact binary log and replay it exactly.
+
+A log starts with a header (format version, random seed and the
+Simulation settings) followed by tagged records, in the order they
+happened:
+
+    S  one step: its dt and the rows of the balls that bounced
+    B  Space was pressed: spawn a ball
+    T  the effect toggles changed (a bitmask over Simulation.TOGGLES)
+    M  the selected modifiers changed
+    Q  the quality governor changed the trail spacing or the particle limit
+    K  a keyframe: the full simulation state, every keyframe_interval seconds
+
+Replaying re-runs the steps with the recorded dt from the nearest keyframe,
+so any moment can be reached quickly, and the recorded bounces are checked
+against the re-simulated ones to catch anything that did not reproduce.
+Play a log back in a window, or check it headless:
+
+    python Replay.py recording.bbr --speed 4 --start 30
+    python Replay.py recording.bbr --headless
+"""
+import argparse
+import bisect
+import io
+import json
+import struct
+import time
+
+import numpy as np
+
+from Modifiers import load_modifiers
+from Simulation import TOGGLES, Simulation
+
+MAGIC = b"BBRP"
+VERSION = 2
+STEP, SPAWN, TOGGLE, MODIFIERS, QUALITY, KEYFRAME = b"S", b"B", b"T", b"M", b"Q", b"K"
+
+
+def pack_state(state):
+    """Simulation.snapshot() as compressed .npz bytes; everything that is not an array goes in a JSON entry."""
+    arrays, meta = {}, {}
+    for section in ("world", "particles"):
+        for key, value in state[section].items():
+            (arrays if isinstance(value, np.ndarray) else meta)[f"{section}.{key}"] = value
+    version, internal, gauss = state["rng"]
+    arrays["rng"] = np.array(internal, dtype=np.uint64)
+    meta.update(rng_version=version, rng_gauss=gauss,
+                **{key: state[key] for key in ("selected_modifiers", "toggles", "trail_every", "time", "steps", "bounces",
+                                      "collisions")})
+    meta = json.dumps(meta, default=lambda value: value.item()).encode()
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, meta=np.frombuffer(meta, dtype=np.uint8), **arrays)
+    return buffer.getvalue()
+
+
+def unpack_state(data):
+    with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+        arrays = {name: archive[name] for name in archive.files}
+    meta = json.loads(arrays.pop("meta").tobytes())
+    state = {"world": {}, "particles": {}}
+    for key, value in list(arrays.items()) + list(meta.items()):
+        section, _, name = key.partition(".")
+        if section in ("world", "particles"):
+            state[section][name] = value
+    state["rng"] = (meta["rng_version"], tuple(int(value) for value in arrays["rng"]), meta["rng_gauss"])
+    for key in ("selected_modifiers", "toggles", "trail_every", "time", "steps", "bounces", "collisions"):
+        state[key] = meta[key]
+    return state
+
+
+def toggle_bits(simulation):
+    return sum(1 << i for i, name in enumerate(TOGGLES) if getattr(simulation, name))
+
+
+def quality_settings(simulation):
+    """The quality governor's settings that change what the simulation does, not just how it is drawn."""
+    return simulation.trail_every, simulation.particles.limit
+
+
+class Recorder:
+    """Drives a Simulation and logs everything needed to replay it.
+
+    Use spawn_ball() and step() instead of the Simulation's own methods;
+    toggle and modifier changes made directly on the simulation are picked
+    up at the next call.
+    """
+
+    def __init__(self, path, simulation, keyframe_interval=5.0):
+        self.path = path
+        self.simulation = simulation
+        self.keyframe_interval = keyframe_interval
+        self.file = open(path, "wb")
+        world = simulation.world
+        header = json.dumps({
+            "seed": simulation.seed,
+            "center": simulation.center.tolist(),
+            "circle_radius": simulation.circle_radius,
+            "boundary_thickness": simulation.boundary_thickness,
+            "gravity": world.gravity.tolist(),
+            "air_resistance": world.air_resistance,
+            "ball_size": simulation.ball_size,
+            "max_particles": simulation.particles.capacity,
+            "max_collision_lines": world.max_collision_lines,
+            "invulnerable_time": simulation.invulnerable_time,
+            "speed_range": list(simulation.speed_range),
+            "keyframe_interval": keyframe_interval,
+        }, default=lambda value: value.item()).encode()
+        self.file.write(MAGIC + struct.pack("<HI", VERSION, len(header)) + header)
+        self.steps = 0
+        self._toggles = toggle_bits(simulation)
+        self._modifiers = tuple(simulation.selected_modifiers)
+        self._quality = quality_settings(simulation)
+        self.keyframe()  # Recording can start mid-session, so the log opens with the full state
+
+    def keyframe(self):
+        data = pack_state(self.simulation.snapshot())
+        self.file.write(KEYFRAME + struct.pack("<dI", self.simulation.time, len(data)) + data)
+        self.file.flush()  # A log cut short by a crash still replays up to here
+        self._next_keyframe = self.simulation.time + self.keyframe_interval
+
+    def _log_changes(self):
+        toggles = toggle_bits(self.simulation)
+        if toggles != self._toggles:
+            self.file.write(TOGGLE + struct.pack("<B", toggles))
+            self._toggles = toggles
+        modifiers = tuple(self.simulation.selected_modifiers)
+        if modifiers != self._modifiers:
+            names = "\n".join(modifiers).encode()
+            self.file.write(MODIFIERS + struct.pack("<H", len(names)) + names)
+            self._modifiers = modifiers
+        quality = quality_settings(self.simulation)
+        if quality != self._quality:
+            self.file.write(QUALITY + struct.pack("<II", *quality))
+            self._quality = quality
+
+    def spawn_ball(self):
+        self._log_changes()
+        self.file.write(SPAWN)
+        return self.simulation.spawn_ball()
+
+    def step(self, dt):
+        self._log_changes()
+        if self.simulation.time >= self._next_keyframe:
+            self.keyframe()
+        bounced = self.simulation.step(dt)
+        self.file.write(STEP + struct.pack("<dI", dt, len(bounced)) + bounced.astype("<u4").tobytes())
+        self.steps += 1
+        return bounced
+
+    def close(self):
+        self.file.close()
+
+
+class Replay:
+    """A recorded log loaded into memory, with a Simulation that can be moved to any recorded time."""
+
+    def __init__(self, path, modifiers=None):
+        with open(path, "rb") as f:
+            data = f.read()
+        if data[:4] != MAGIC:
+            raise ValueError(f"{path} is not a replay log")
+        version, header_length = struct.unpack_from("<HI", data, 4)
+        if version != VERSION:
+            raise ValueError(f"{path} is replay format {version}, expected {VERSION}")
+        offset = 10 + header_length
+        self.header = json.loads(data[10:offset])
+
+        self.records = []  # (tag, payload)
+        self.keyframe_times = []
+        self.keyframe_records = []
+        self.end_time = 0.0
+        clock = 0.0
+        try:
+            while offset < len(data):
+                tag = data[offset:offset + 1]
+                offset += 1
+                if tag == STEP:
+                    dt, count = struct.unpack_from("<dI", data, offset)
+                    offset += 12
+                    if offset + 4 * count > len(data):
+                        break
+                    bounced = np.frombuffer(data, dtype="<u4", count=count, offset=offset)
+                    offset += 4 * count
+                    payload = (dt, bounced)
+                    clock += dt
+                elif tag == SPAWN:
+                    payload = None
+                elif tag == TOGGLE:
+                    payload = data[offset]
+                    offset += 1
+                elif tag == MODIFIERS:
+                    length, = struct.unpack_from("<H", data, offset)
+                    names = data[offset + 2:offset + 2 + length].decode()
+                    offset += 2 + length
+                    payload = names.split("\n") if names else []
+                elif tag == QUALITY:
+                    payload = struct.unpack_from("<II", data, offset)
+                    offset += 8
+                elif tag == KEYFRAME:
+                    clock, length = struct.unpack_from("<dI", data, offset)
+                    payload = data[offset + 12:offset + 12 + length]
+                    if len(payload) < length:
+                        break
+                    offset += 12 + length
+                    self.keyframe_times.append(clock)
+                    self.keyframe_records.append(len(self.records))
+                else:
+                    raise ValueError(f"{path} has an unknown record {tag!r} at byte {offset - 1}")
+                self.records.append((tag, payload))
+                self.end_time = clock
+        except (struct.error, IndexError):
+            pass  # The recording was cut off mid-record; keep everything before it
+        if not self.keyframe_records:
+            raise ValueError(f"{path} has no keyframe to start from")
+        self.start_time = self.keyframe_times[0]  # Simulation time when recording started
+
+        header = self.header
+        self.simulation = Simulation(header["center"], header["circle_radius"], header["boundary_thickness"],
+                                     header["gravity"], header["air_resistance"], header["ball_size"],
+                                     seed=header["seed"], modifiers=load_modifiers() if modifiers is None else modifiers,
+                                     max_particles=header["max_particles"],
+                                     max_collision_lines=header["max_collision_lines"],
+                                     invulnerable_time=header["invulnerable_time"],
+                                     speed_range=tuple(header["speed_range"]))
+        self.simulation.isolate_modifiers = True  # A modifier that raised while recording must be turned off here too
+        self.position = 0
+        self.desyncs = 0  # Steps whose bounces differed from the recording
+        self.seek(self.start_time)
+
+    @property
+    def finished(self):
+        return self.position >= len(self.records)
+
+    def seek(self, target_time):
+        """Restore the last keyframe at or before target_time and simulate forward to it."""
+        k = max(bisect.bisect_right(self.keyframe_times, target_time) - 1, 0)
+        self.position = self.keyframe_records[k]
+        self.simulation.load_snapshot(unpack_state(self.records[self.position][1]))
+        self.position += 1
+        return self.advance(target_time)
+
+    def advance(self, target_time):
+        """Apply records until the next step would pass target_time; return the bounced rows of every step taken."""
+        simulation = self.simulation
+        bounced = []
+        while self.position < len(self.records):
+            tag, payload = self.records[self.position]
+            if tag == STEP:
+                dt, recorded = payload
+                if simulation.time + dt > target_time + 1e-9:
+                    break
+                step_bounced = simulation.step(dt)
+                if not np.array_equal(step_bounced, recorded):
+                    self.desyncs += 1
+                bounced.append(step_bounced)
+            elif tag == SPAWN:
+                simulation.spawn_ball()
+            elif tag == TOGGLE:
+                for i, name in enumerate(TOGGLES):
+                    setattr(simulation, name, bool(payload >> i & 1))
+            elif tag == MODIFIERS:
+                simulation.selected_modifiers = list(payload)
+            elif tag == QUALITY:
+                simulation.trail_every, simulation.particles.limit = payload
+            self.position += 1  # Keyframes passed on the way need no work; the state already matches
+        return bounced
+
+
+def play(replay, speed, start):
+    import pygame
+
+    from Rendering import Renderer, SpriteCache
+
+    pygame.display.init()
+    pygame.font.init()
+    size = (int(replay.simulation.center[0] * 2), int(replay.simulation.center[1] * 2))
+    screen = pygame.display.set_mode(size)
+    renderer = Renderer(size, SpriteCache(64 * 1024 * 1024))
+    font = pygame.font.Font(None, 24)
+    clock = pygame.time.Clock()
+    playback_time = min(max(start, replay.start_time), replay.end_time)
+    replay.seek(playback_time)
+    paused = False
+    running = True
+    while running:
+        dt = clock.tick(60) / 1000.0
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_SPACE:
+                    paused = not paused
+                elif event.key == pygame.K_UP:
+                    speed *= 2
+                elif event.key == pygame.K_DOWN:
+                    speed /= 2
+                elif event.key in (pygame.K_LEFT, pygame.K_RIGHT, pygame.K_HOME):
+                    if event.key == pygame.K_HOME:
+                        playback_time = replay.start_time
+                    else:
+                        playback_time += 5.0 if event.key == pygame.K_RIGHT else -5.0
+                    playback_time = min(max(playback_time, replay.start_time), replay.end_time)
+                    replay.seek(playback_time)
+        if not paused:
+            playback_time = min(playback_time + dt * speed, replay.end_time)
+            replay.advance(playback_time)
+
+        renderer.draw(screen, replay.simulation, pygame.Color(255, 255, 255))
+        status = f"{playback_time:6.2f} / {replay.end_time:.2f} s   x{speed:g}{'   paused' if paused else ''}"
+        if replay.desyncs:
+            status += f"   {replay.desyncs} desynced steps"
+        screen.blit(font.render(status, True, (255, 255, 255)), (10, 10))
+        pygame.display.flip()
+    pygame.quit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded session (press 8 in the game to record one).")
+    parser.add_argument("log", help="recording to play back")
+    parser.add_argument("--speed", type=float, default=1.0, help="playback speed, 2 is twice real time (default: 1)")
+    parser.add_argument("--start", type=float, default=0.0, metavar="SECONDS",
+                        help="start playing at this simulation time (default: where the recording starts)")
+    parser.add_argument("--headless", action="store_true",
+                        help="replay to the end as fast as possible without a window and report whether it reproduced")
+    args = parser.parse_args(argv)
+
+    replay = Replay(args.log)
+    if not args.headless:
+        play(replay, args.speed, args.start)
+        return
+
+    start = time.perf_counter()
+    replay.seek(max(args.start, replay.start_time))
+    from_time = replay.simulation.time
+    replay.advance(replay.end_time)
+    elapsed = time.perf_counter() - start
+    simulation = replay.simulation
+    print(f"recorded:      {replay.start_time:.2f} to {replay.end_time:.2f} s in {len(replay.records)} records, "
+          f"{len(replay.keyframe_times)} keyframes")
+    print(f"replayed:      {simulation.time - from_time:.2f} s in {elapsed:.2f} s")
+    print(f"bounces:       {simulation.bounces}")
+    print(f"collisions:    {simulation.collisions}")
+    print(f"balls left:    {simulation.world.count}")
+    print(f"desynced steps: {replay.desyncs}")
+
+
+if __name__ == "__main__":
+    main()
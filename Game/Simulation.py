@@ -0,0 +1,259 @@
+"""The game simulation, without a window, sound or pygame.
+
+Simulation owns the balls, the growing-circle particles and the selected
+modifiers, and advances them one step at a time. Main.py drives it with the
+frame time. Run from the command line, it steps with a fixed timestep and a
+seeded random generator, as fast as the CPU allows:
+
+    python Simulation.py --balls 200 --seed 1 --steps 5000 --modifier Shrink_on_bounce
+"""
+import argparse
+import colorsys
+import random
+import time
+
+import numpy as np
+
+from Engine import BallWorld
+from Modifiers import ALL_EVENTS, build_dispatch, load_modifiers
+from Particles import ParticlePool
+from Profiler import profiler
+
+TOGGLES = ("show_lines", "show_trail", "show_background_growing_circle", "show_collision_growing_circle")
+
+
+def check_modifier_names(parser, names, modifiers):
+    """Stop a command line with a usage error if any of the named modifiers does not exist."""
+    unknown = sorted({name for name in names if name not in modifiers})
+    if unknown:
+        parser.error("unknown modifier(s): %s" % ", ".join(unknown))
+
+
+def random_velocity(rng, speed_range=(100, 1000)):
+    angle = rng.uniform(0, 2 * np.pi)
+    speed = rng.uniform(*speed_range)
+    return np.array([speed * np.cos(angle), speed * np.sin(angle)], dtype='float64')
+
+
+def random_color(rng):
+    hue = rng.randint(0, 360)
+    r, g, b = colorsys.hsv_to_rgb(hue / 360, 1, 1)
+    return (round(r * 255), round(g * 255), round(b * 255))
+
+
+class Simulation:
+    def __init__(self, center=(360, 360), circle_radius=300, boundary_thickness=10, gravity=(0, 300),
+                 air_resistance=0.9995, ball_size=100, seed=None, modifiers=None,
+                 max_particles=8192, max_collision_lines=128, invulnerable_time=999999999, speed_range=(100, 1000)):
+        self.center = np.array(center, dtype='float64')
+        self.circle_radius = circle_radius
+        self.boundary_thickness = boundary_thickness
+        self.ball_size = ball_size
+        self.invulnerable_time = invulnerable_time
+        self.speed_range = speed_range  # Launch speeds of new balls, in pixels per second
+        self.seed = random.randrange(2 ** 32) if seed is None else seed  # Kept so a session can be recorded and replayed
+        self.rng = random.Random(self.seed)
+        self.world = BallWorld(self.center, circle_radius, boundary_thickness, gravity, air_resistance,
+                               max_collision_lines=max_collision_lines)
+        self.particles = ParticlePool(max_particles)
+        self.modifiers = modifiers if modifiers is not None else {}
+        self.selected_modifiers = []
+        self._dispatch = {ALL_EVENTS: []}
+        self._dispatch_key = ()  # The selection the dispatch table was built for
+        self._dispatch_modifiers = self.modifiers  # And the modifiers; reloading swaps in a new dict
+        # With isolate_modifiers, a modifier that raises is deselected instead of crashing the step, and
+        # one that takes longer than slow_modifier_time is reported once; both land in modifier_problems
+        self.isolate_modifiers = False
+        self.slow_modifier_time = 0.008
+        self.modifier_problems = []
+        self._slow_modifiers = set()
+
+        # Toggle features
+        self.show_lines = True
+        self.show_trail = True
+        self.show_background_growing_circle = True
+        self.show_collision_growing_circle = True
+        self.trail_every = 1  # Emit trail circles every this many steps; raised by the quality governor
+
+        self.time = 0.0
+        self.steps = 0
+        self.bounces = 0
+        self.collisions = 0
+
+    def spawn_ball(self):
+        return self.world.add(self.center[0], self.center[1], self.ball_size, random_color(self.rng),
+                              random_velocity(self.rng, self.speed_range), self.invulnerable_time)
+
+    def disable_effects(self):
+        """Turn off lines, trails and growing circles, leaving just the balls."""
+        for name in TOGGLES:
+            setattr(self, name, False)
+
+    def set_modifiers(self, modifiers):
+        """Swap in a new modifiers dict, e.g. after a reload; the selection is kept by name."""
+        self.modifiers = modifiers
+        self._slow_modifiers.clear()  # A reloaded modifier may be fast now
+
+    def dispatch_event(self, event_name, indices):
+        """Run every selected modifier that handles event_name on the given ball rows."""
+        key = tuple(self.selected_modifiers)
+        if key != self._dispatch_key or self.modifiers is not self._dispatch_modifiers:
+            self._dispatch = build_dispatch(self.modifiers, key)
+            self._dispatch_key = key
+            self._dispatch_modifiers = self.modifiers
+        handlers = self._dispatch.get(event_name, self._dispatch[ALL_EVENTS])
+        if not handlers or len(indices) == 0:
+            return
+        indices = np.asarray(indices, dtype=np.intp)
+        rounds = [indices]
+        if len(indices) > 1:
+            # A ball that bounced twice this step is handled twice, in separate calls, so
+            # batched handlers can index with it without its updates collapsing into one
+            order = np.argsort(indices, kind='stable')
+            sorted_indices = indices[order]
+            first = np.r_[True, sorted_indices[1:] != sorted_indices[:-1]]
+            if not first.all():
+                position = np.arange(len(indices))
+                repeat = np.empty(len(indices), dtype=np.intp)
+                repeat[order] = position - np.maximum.accumulate(np.where(first, position, 0))
+                rounds = [indices[repeat == k] for k in range(int(repeat.max()) + 1)]
+        if not self.isolate_modifiers:
+            for batch in rounds:
+                for _, handler in handlers:
+                    handler(event_name, self.world, batch, self)
+            return
+
+        failed = set()
+        for batch in rounds:
+            for name, handler in handlers:
+                if name in failed:
+                    continue
+                start = time.perf_counter()
+                try:
+                    handler(event_name, self.world, batch, self)
+                except Exception as error:
+                    failed.add(name)
+                    if name in self.selected_modifiers:
+                        self.selected_modifiers.remove(name)
+                    self.modifier_problems.append(f"Modifier {name} failed and was turned off: {type(error).__name__}: {error}")
+                    continue
+                elapsed = time.perf_counter() - start
+                if elapsed > self.slow_modifier_time and name not in self._slow_modifiers:
+                    self._slow_modifiers.add(name)
+                    self.modifier_problems.append(f"Modifier {name} is slow: {elapsed * 1000:.0f} ms on {event_name}")
+
+    def snapshot(self):
+        """Copy of the whole simulation state, enough to continue it exactly with load_snapshot."""
+        return {
+            "world": self.world.snapshot(),
+            "particles": self.particles.snapshot(),
+            "rng": self.rng.getstate(),
+            "selected_modifiers": list(self.selected_modifiers),
+            "toggles": {name: getattr(self, name) for name in TOGGLES},
+            "trail_every": self.trail_every,
+            "time": self.time,
+            "steps": self.steps,
+            "bounces": self.bounces,
+            "collisions": self.collisions,
+        }
+
+    def load_snapshot(self, state):
+        self.world = BallWorld.from_snapshot(state["world"])
+        self.particles = ParticlePool.from_snapshot(state["particles"])
+        self.rng.setstate(state["rng"])
+        self.selected_modifiers = list(state["selected_modifiers"])
+        for name, value in state["toggles"].items():
+            setattr(self, name, value)
+        self.trail_every = state["trail_every"]
+        self.time = state["time"]
+        self.steps = state["steps"]
+        self.bounces = state["bounces"]
+        self.collisions = state["collisions"]
+
+    def apply_modifier(self, event_name, ball):
+        self.dispatch_event(event_name, (ball.index,))
+
+    def step(self, dt):
+        """Advance everything by dt and return the indices of the balls that bounced."""
+        with profiler.span("physics"):
+            bounced = self.update_balls(dt)
+        with profiler.span("ball collisions"):
+            self.check_ball_collisions()
+        with profiler.span("particles"):
+            self.update_particles(dt)
+        self.time += dt
+        self.steps += 1
+        return bounced
+
+    def update_balls(self, dt):
+        world = self.world
+        bounced, collision_points = world.step(dt)
+
+        if bounced.size:
+            colors = world.color[bounced]
+            if self.show_lines:
+                world.record_collision_points(bounced, collision_points)
+            if self.show_collision_growing_circle:
+                self.particles.emit_many(collision_points, 25, 10, colors)
+            if self.show_background_growing_circle:
+                self.particles.emit_many(np.broadcast_to(self.center, collision_points.shape),
+                                         self.circle_radius + (self.boundary_thickness / 2), 25, colors, layer=0)
+            self.dispatch_event("ball_bounce", bounced)
+
+        if self.show_trail and self.steps % self.trail_every == 0:
+            n = world.count
+            self.particles.emit_many(world.pos[:n], world.radius[:n], -140, world.color[:n], 150, 200)
+
+        world.fade_collision_lines(dt)
+        self.bounces += len(bounced)
+        return bounced
+
+    def check_ball_collisions(self):
+        removed = self.world.find_collisions()
+        self.world.remove(removed)
+        self.collisions += len(removed) // 2
+
+    def update_particles(self, dt):
+        self.particles.update(dt)
+
+
+def main(argv=None):
+    modifiers = load_modifiers()
+    parser = argparse.ArgumentParser(description="Run the bouncing ball simulation headless with a fixed timestep.")
+    parser.add_argument("--balls", type=int, default=100, help="balls spawned at the start (default: 100)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for ball velocities and colours (default: 0)")
+    parser.add_argument("--steps", type=int, default=3600, help="number of steps to simulate (default: 3600)")
+    parser.add_argument("--dt", type=float, default=1 / 60, help="seconds per step (default: 1/60)")
+    parser.add_argument("--modifier", action="append", default=[], metavar="NAME",
+                        help="enable a modifier by file name; repeat for several (available: %s)" % ", ".join(modifiers))
+    parser.add_argument("--invulnerable-time", type=float, default=999999999,
+                        help="seconds before a new ball can be destroyed by another (default: never)")
+    parser.add_argument("--no-effects", action="store_true", help="skip lines, trails and growing circles")
+    args = parser.parse_args(argv)
+
+    check_modifier_names(parser, args.modifier, modifiers)
+
+    simulation = Simulation(seed=args.seed, modifiers=modifiers, invulnerable_time=args.invulnerable_time)
+    simulation.selected_modifiers = list(args.modifier)
+    if args.no_effects:
+        simulation.disable_effects()
+
+    for _ in range(args.balls):
+        simulation.spawn_ball()
+
+    start = time.perf_counter()
+    for _ in range(args.steps):
+        simulation.step(args.dt)
+    elapsed = time.perf_counter() - start
+
+    print(f"steps:         {simulation.steps}")
+    print(f"simulated:     {simulation.time:.2f} s")
+    print(f"wall time:     {elapsed:.2f} s")
+    print(f"steps/s:       {simulation.steps / elapsed if elapsed > 0 else float('inf'):.1f}")
+    print(f"bounces:       {simulation.bounces}")
+    print(f"collisions:    {simulation.collisions}")
+    print(f"balls left:    {simulation.world.count}")
+
+
+if __name__ == "__main__":
+    main()
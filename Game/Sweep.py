@@ -0,0 +1,158 @@
+"""Parameter sweeps over headless simulations.
+
+Every combination of the given gravity, air resistance, ball size,
+boundary thickness, launch speed range, modifier set and seed is run as a
+headless Simulation in a process pool. Each run reports aggregate
+statistics (bounce rate, time to the first ball-ball collision, how many
+balls survive, the final size distribution) and the rows are written to
+one columnar file, .npz or .csv depending on the output name:
+
+    python Sweep.py --gravity 0,300 0,600 --ball-size 50 100 --speed 100:1000 500:2000 \\
+        --modifiers none Shrink_on_bounce "Shrink_on_bounce+Grow on bounce" --seeds 3 --output sweep.npz
+"""
+import argparse
+import csv
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from Modifiers import load_modifiers
+from Simulation import Simulation, check_modifier_names
+
+CONFIG_COLUMNS = ("gravity_x", "gravity_y", "air_resistance", "ball_size", "boundary_thickness",
+                  "speed_min", "speed_max", "modifiers", "seed")
+STAT_COLUMNS = ("bounces", "bounce_rate", "collisions", "first_collision_time", "survival", "balls_left",
+                "size_mean", "size_std", "size_min", "size_p50", "size_max", "wall_time")
+
+_modifiers = None
+
+
+def run_config(config, balls, steps, dt, invulnerable_time):
+    """Run one configuration and return its statistics, keyed like STAT_COLUMNS."""
+    global _modifiers
+    if _modifiers is None:
+        _modifiers = load_modifiers()  # Once per worker process
+
+    simulation = Simulation(gravity=(config["gravity_x"], config["gravity_y"]),
+                            air_resistance=config["air_resistance"],
+                            ball_size=config["ball_size"],
+                            boundary_thickness=config["boundary_thickness"],
+                            speed_range=(config["speed_min"], config["speed_max"]),
+                            seed=config["seed"],
+                            modifiers=_modifiers,
+                            invulnerable_time=invulnerable_time)
+    simulation.selected_modifiers = [name for name in config["modifiers"].split("+") if name]
+    simulation.disable_effects()
+    for _ in range(balls):
+        simulation.spawn_ball()
+
+    first_collision_time = np.nan
+    start = time.perf_counter()
+    for _ in range(steps):
+        simulation.step(dt)
+        if simulation.collisions and np.isnan(first_collision_time):
+            first_collision_time = simulation.time
+    wall_time = time.perf_counter() - start
+
+    world = simulation.world
+    sizes = world.size[:world.count]
+    if sizes.size:
+        size_stats = (sizes.mean(), sizes.std(), sizes.min(), np.median(sizes), sizes.max())
+    else:
+        size_stats = (np.nan,) * 5
+    return dict(zip(STAT_COLUMNS, (
+        simulation.bounces,
+        simulation.bounces / simulation.time if simulation.time else 0.0,
+        simulation.collisions,
+        first_collision_time,
+        world.count / balls if balls else 0.0,
+        world.count,
+        *size_stats,
+        wall_time,
+    )))
+
+
+def _run(job):
+    return run_config(*job)
+
+
+def build_grid(args):
+    configs = []
+    for gravity, air_resistance, ball_size, thickness, speed, modifiers, seed in itertools.product(
+            args.gravity, args.air_resistance, args.ball_size, args.boundary_thickness,
+            args.speed, args.modifiers, range(args.seed, args.seed + args.seeds)):
+        configs.append(dict(zip(CONFIG_COLUMNS, (
+            gravity[0], gravity[1], air_resistance, ball_size, thickness, speed[0], speed[1],
+            "" if modifiers == "none" else modifiers, seed))))
+    return configs
+
+
+def write_results(path, configs, results):
+    rows = [{**config, **result} for config, result in zip(configs, results)]
+    columns = CONFIG_COLUMNS + STAT_COLUMNS
+    if path.endswith(".csv"):
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, columns)
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        np.savez(path, **{column: np.array([row[column] for row in rows]) for column in columns})
+
+
+def pair(separator, kind=float):
+    def parse(text):
+        try:
+            first, second = (kind(part) for part in text.split(separator))
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"expected two numbers separated by '{separator}', got {text!r}")
+        return first, second
+    return parse
+
+
+def main(argv=None):
+    modifiers = load_modifiers()
+    parser = argparse.ArgumentParser(description="Sweep simulation parameters across a process pool.")
+    parser.add_argument("--gravity", nargs="+", type=pair(","), default=[(0.0, 300.0)], metavar="X,Y",
+                        help="gravity vectors in px/s^2 (default: 0,300)")
+    parser.add_argument("--air-resistance", nargs="+", type=float, default=[0.9995], metavar="K",
+                        help="velocity kept per step, 1 means no air resistance (default: 0.9995)")
+    parser.add_argument("--ball-size", nargs="+", type=float, default=[100.0], metavar="PX", help="ball diameters (default: 100)")
+    parser.add_argument("--boundary-thickness", nargs="+", type=float, default=[10.0], metavar="PX",
+                        help="boundary ring thicknesses (default: 10)")
+    parser.add_argument("--speed", nargs="+", type=pair(":"), default=[(100.0, 1000.0)], metavar="MIN:MAX",
+                        help="uniform launch speed ranges in px/s (default: 100:1000)")
+    parser.add_argument("--modifiers", nargs="+", default=["none"], metavar="A+B",
+                        help="modifier sets, names joined with '+', or 'none' (available: %s)" % ", ".join(modifiers))
+    parser.add_argument("--seed", type=int, default=0, help="first random seed (default: 0)")
+    parser.add_argument("--seeds", type=int, default=1, help="seeds per configuration (default: 1)")
+    parser.add_argument("--balls", type=int, default=20, help="balls spawned at the start of each run (default: 20)")
+    parser.add_argument("--steps", type=int, default=3600, help="steps per run (default: 3600)")
+    parser.add_argument("--dt", type=float, default=1 / 60, help="seconds per step (default: 1/60)")
+    parser.add_argument("--invulnerable-time", type=float, default=1.0,
+                        help="seconds before new balls can destroy each other (default: 1)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes (default: one per CPU)")
+    parser.add_argument("--output", default="sweep.npz", help="results file, .npz or .csv (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    check_modifier_names(parser, [name for combo in args.modifiers if combo != "none" for name in combo.split("+")],
+                         modifiers)
+
+    configs = build_grid(args)
+    jobs = [(config, args.balls, args.steps, args.dt, args.invulnerable_time) for config in configs]
+    print(f"Running {len(configs)} configurations on {args.workers} workers")
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(args.workers) as pool:
+        for i, result in enumerate(pool.map(_run, jobs, chunksize=max(1, len(jobs) // (args.workers * 8)))):
+            results.append(result)
+            print(f"\r{i + 1}/{len(jobs)}", end="", flush=True)
+    print()
+    write_results(args.output, configs, results)
+    print(f"Wrote {len(results)} rows to {args.output} in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
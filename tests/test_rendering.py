@@ -0,0 +1,62 @@
+import os
+import sys
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "Game"))
+
+import numpy as np
+import pygame
+
+from Engine import BallWorld
+from Rendering import Renderer, SpriteCache
+
+
+def crossing_world():
+    """Two balls, the second with a translucent collision line running straight through the first."""
+    world = BallWorld((200, 200), 180, 10, (0, 0), 0)
+    world.add(150, 200, 40, (163, 0, 90), (0, 0))
+    world.add(260, 200, 40, (0, 0, 255), (0, 0))
+    world.line_points[1, 0] = (30, 200)
+    world.line_count[1] = 1
+    world.line_head[1] = 1
+    world.line_opacity[1] = 90
+    return world
+
+
+def render_balls(use_shared_overlay):
+    pygame.display.init()
+    pygame.display.set_mode((1, 1))
+    screen = pygame.Surface((400, 400))
+    renderer = Renderer((400, 400), SpriteCache(1 << 20), use_shared_overlay=use_shared_overlay)
+    renderer.draw_balls(screen, crossing_world(), True)
+    return pygame.surfarray.array3d(screen).astype(int)
+
+
+def test_collision_lines_blend_over_earlier_balls():
+    shared = render_balls(True)
+    per_ball = render_balls(False)
+    # The line crosses the first ball's rim here; overwriting instead of blending used to leave (0, 0, 90)
+    assert shared[132, 200].tolist() != [0, 0, 90]
+    assert np.abs(shared - per_ball).max() <= 2
+
+
+def test_shared_overlay_matches_per_ball_surfaces_with_lines():
+    from Simulation import Simulation
+
+    simulation = Simulation(seed=1, modifiers={})
+    for _ in range(30):
+        simulation.spawn_ball()
+    for _ in range(120):
+        simulation.step(1 / 60)
+    assert simulation.world.line_count[:simulation.world.count].sum() > 0
+
+    pygame.display.init()
+    pygame.display.set_mode((1, 1))
+    frames = []
+    for use_shared_overlay in (True, False):
+        screen = pygame.Surface((720, 720))
+        renderer = Renderer((720, 720), SpriteCache(1 << 24), use_shared_overlay=use_shared_overlay)
+        renderer.draw_balls(screen, simulation.world, True)
+        frames.append(pygame.surfarray.array3d(screen).astype(int))
+    # Only the anti-aliased rims of overlapping balls blend a little differently through the shared layer
+    assert (np.abs(frames[0] - frames[1]).max(axis=2) > 2).mean() < 0.001